@@ -1,6 +1,166 @@
+import hashlib
+
 import pandas as pd
 import numpy as np
 import talib
+from numba import njit
+
+
+# کش اندیکاتورهای مستقل از پارامترهای استراتژی (ATR، RSI، SMA روند)
+# در جستجوی شبکه‌ای روی پارامترها، این‌ها برای یک داده قیمتی ثابت‌اند
+# و نباید برای هر کاندید دوباره محاسبه شوند
+_INDICATOR_CACHE = {}
+_INDICATOR_CACHE_MAX = 64
+
+
+def _price_digest(df):
+    """اثر انگشت محتوای ستون‌های قیمتی فریم
+
+    کلید بر اساس id(df) بعد از GC قابل استفاده مجدد است و در جستجوی
+    شبکه‌ای هم هر instance با assign فریم (و id) تازه می‌سازد؛ digest
+    محتوا در هر دو حالت پایدار است و بین همه کاندیدها مشترک می‌ماند.
+    """
+    h = hashlib.md5()
+    for col in ('High', 'Low', 'Close'):
+        if col in df.columns:
+            h.update(df[col].to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def cached_indicator(df, name, params, compute):
+    """نتیجه compute() را با کلید (digest داده قیمتی، نام، پارامترها) کش می‌کند"""
+    key = (_price_digest(df), name, params)
+    result = _INDICATOR_CACHE.get(key)
+    if result is None:
+        if len(_INDICATOR_CACHE) >= _INDICATOR_CACHE_MAX:
+            _INDICATOR_CACHE.clear()
+        result = compute()
+        _INDICATOR_CACHE[key] = result
+    return result
+
+
+@njit(cache=True, fastmath=True)
+def _ema(x, span):
+    """EMA با بازگشت O(n) — نه جمع وزنی O(n²) برای هر نقطه
+
+    out[i] = alpha*x[i] + (1-alpha)*out[i-1]
+    """
+    alpha = 2.0 / (span + 1.0)
+    out = np.empty_like(x)
+    out[0] = x[0]
+    for i in range(1, x.shape[0]):
+        out[i] = alpha * x[i] + (1.0 - alpha) * out[i - 1]
+    return out
+
+
+def macd_numpy(close, fast_period=12, slow_period=26, signal_period=9):
+    """MACD بدون TA-Lib روی آرایه خام؛ هر سه خط با بازگشت خطی EMA
+
+    خروجی: (macd, signal_line, histogram) — برای مسیرهایی که
+    نمی‌خواهند به TA-Lib وابسته باشند.
+    """
+    macd = _ema(close, fast_period) - _ema(close, slow_period)
+    signal_line = _ema(macd, signal_period)
+    return macd, signal_line, macd - signal_line
+
+
+@njit(cache=True, fastmath=True)
+def atr_numpy(high, low, close, timeperiod=14):
+    """ATR بدون TA-Lib: برد واقعی + هموارسازی Wilder در دو حلقه فشرده
+
+    rma[i] = (rma[i-1]*(n-1) + tr[i]) / n — همان بازگشتی که TA-Lib
+    در C اجرا می‌کند، بدون کپی pandas ↔ TA-Lib.
+    """
+    n = timeperiod
+    m = close.shape[0]
+
+    tr = np.empty_like(close)
+    tr[0] = high[0] - low[0]
+    for i in range(1, m):
+        hl = high[i] - low[i]
+        hc = abs(high[i] - close[i - 1])
+        lc = abs(low[i] - close[i - 1])
+        tr[i] = max(hl, hc, lc)
+
+    out = np.full(m, np.nan)
+    if m < n:
+        return out
+
+    # بذر اولیه: میانگین ساده n مقدار اول، بعد بازگشت Wilder
+    seed = 0.0
+    for i in range(n):
+        seed += tr[i]
+    rma = seed / n
+    out[n - 1] = rma
+    for i in range(n, m):
+        rma = (rma * (n - 1) + tr[i]) / n
+        out[i] = rma
+    return out
+
+
+def _cross_above(a, b):
+    """تقاطع صعودی a از روی b — بدون شاخه، فقط روی بیت علامت تفاضل
+
+    signbit(a - b) به صورت SIMD برداری می‌شود؛ تقاطع یعنی
+    «قبلاً زیر بود و حالا بالا است».
+    """
+    below = np.signbit(a - b)
+    cross = np.zeros(a.shape[0], dtype=bool)
+    cross[1:] = below[:-1] & ~below[1:]
+    return cross
+
+
+@njit(cache=True, fastmath=True)
+def _run_macd_state_machine(close, atr, cross_up, cross_down,
+                            hist_increasing, trend_ok, rsi_ok,
+                            atr_multiplier, slippage):
+    """ماشین حالت ورود/خروج MACD روی آرایه‌های خام (کامپایل‌شده با Numba)"""
+    n = close.shape[0]
+    signals = np.zeros(n, dtype=np.int8)
+    stop_loss = np.full(n, np.nan)
+    entry_prices = np.full(n, np.nan)
+    # کد نوع معامله: 0=هیچ, 1=BUY, 2=SELL_SIGNAL, 3=SELL_STOP
+    trade_codes = np.zeros(n, dtype=np.int8)
+    positions = np.zeros(n, dtype=np.int8)
+
+    position = 0
+    stop_price = 0.0
+
+    for i in range(1, n):
+        if position == 0:  # بدون پوزیشن
+            if cross_up[i] and hist_increasing[i] and trend_ok[i] and rsi_ok[i]:
+                # ورود خرید
+                position = 1
+                entry_price = close[i] * (1 + slippage)
+                stop_price = entry_price - atr_multiplier * atr[i]
+
+                signals[i] = 1
+                stop_loss[i] = stop_price
+                entry_prices[i] = entry_price
+                trade_codes[i] = 1
+
+        elif position == 1:  # در پوزیشن خرید
+            stop_loss_hit = close[i] <= stop_price
+
+            if cross_down[i] or stop_loss_hit:
+                position = 0
+                signals[i] = -1
+                trade_codes[i] = 3 if stop_loss_hit else 2
+            else:
+                # Trailing Stop Loss
+                new_stop = close[i] - atr_multiplier * atr[i]
+                if new_stop > stop_price:
+                    stop_price = new_stop
+                    stop_loss[i] = stop_price
+
+        positions[i] = position
+
+    return signals, stop_loss, entry_prices, trade_codes, positions
+
+
+# نگاشت کد عددی نوع معامله به برچسب متنی
+_MACD_TRADE_TYPES = ('', 'BUY', 'SELL_SIGNAL', 'SELL_STOP')
+
 
 class MACDMomentumStrategyPro:
     """
@@ -25,7 +185,9 @@ class MACDMomentumStrategyPro:
             use_trend_filter: استفاده از فیلتر روند
             trend_ma_period: دوره میانگین برای فیلتر روند
         """
-        self.df = df.copy()
+        # بدون copy: محاسبه اندیکاتورها با assign/dropna فریم جدید می‌سازد
+        # و فریم ورودی هرگز in-place تغییر نمی‌کند
+        self.df = df
         self.fast_period = fast_period
         self.slow_period = slow_period
         self.signal_period = signal_period
@@ -53,173 +215,229 @@ class MACDMomentumStrategyPro:
         min_required = max(self.slow_period + self.signal_period, self.trend_ma_period)
         if len(self.df) < min_required:
             raise ValueError(f"داده کافی نیست. حداقل {min_required} کندل نیاز است")
+
+        # کاهش دقت ستون‌های قیمتی به float32؛ برای دقت مورد نیاز بک‌تست کافی است
+        # و ترافیک حافظه محاسبات پایین‌دستی را نصف می‌کند
+        price_cols = ['Open', 'High', 'Low', 'Close']
+        self.df = self.df.assign(
+            **{col: self.df[col].astype(np.float32) for col in price_cols})
     
     def calculate_indicators(self):
         """محاسبه MACD و سایر اندیکاتورها"""
         try:
+            # استخراج یک‌باره آرایه‌های پیوسته float64؛
+            # همه اندیکاتورها از همین بافرها تغذیه می‌شوند (بدون round-trip در pandas)
+            close = np.ascontiguousarray(self.df['Close'].to_numpy(dtype=np.float64))
+            high = np.ascontiguousarray(self.df['High'].to_numpy(dtype=np.float64))
+            low = np.ascontiguousarray(self.df['Low'].to_numpy(dtype=np.float64))
+
             # محاسبه MACD با TA-Lib (سریع‌تر و دقیق‌تر)
-            self.df['macd'], self.df['signal'], self.df['histogram'] = talib.MACD(
-                self.df['Close'],
+            macd, signal_line, histogram = talib.MACD(
+                close,
                 fastperiod=self.fast_period,
                 slowperiod=self.slow_period,
                 signalperiod=self.signal_period
             )
-            
-            # ATR برای Stop Loss
-            self.df['atr'] = talib.ATR(
-                self.df['High'],
-                self.df['Low'],
-                self.df['Close'],
-                timeperiod=14
-            )
-            
-            # فیلتر روند (اختیاری)
+
+            # ATR/RSI/SMA مستقل از پارامترهای MACD هستند؛ در جستجوی شبکه‌ای کش می‌شوند
+            source_df = self.df
+            computed = {
+                'macd': macd.astype(np.float32),
+                'signal_line': signal_line.astype(np.float32),
+                'histogram': histogram.astype(np.float32),
+                # ATR برای Stop Loss
+                'atr': cached_indicator(
+                    source_df, 'atr', (14,),
+                    lambda: talib.ATR(high, low, close, timeperiod=14).astype(np.float32)),
+                # RSI برای فیلتر اضافی (جلوگیری از ورود در overbought/oversold)
+                'rsi': cached_indicator(
+                    source_df, 'rsi', (14,),
+                    lambda: talib.RSI(close, timeperiod=14).astype(np.float32)),
+            }
+
+            # فیلتر روند (اختیاری) — SMA تک‌گذر TA-Lib به جای بافر پنجره‌ای pandas
             if self.use_trend_filter:
-                self.df['trend_ma'] = self.df['Close'].rolling(window=self.trend_ma_period).mean()
-                self.df['trend_direction'] = np.where(
-                    self.df['Close'] > self.df['trend_ma'], 1, -1
-                )
-            
-            # RSI برای فیلتر اضافی (جلوگیری از ورود در overbought/oversold)
-            self.df['rsi'] = talib.RSI(self.df['Close'], timeperiod=14)
-            
-            # حذف NaN
-            self.df = self.df.dropna()
-            
+                trend_ma = cached_indicator(
+                    source_df, 'sma', (self.trend_ma_period,),
+                    lambda: talib.SMA(close, timeperiod=self.trend_ma_period).astype(np.float32))
+                computed['trend_ma'] = trend_ma
+                # خروجی int8؛ ۸ برابر کوچک‌تر از int64 پیش‌فرض np.where
+                computed['trend_direction'] = np.where(
+                    close > trend_ma, np.int8(1), np.int8(-1))
+
+            # افزودن همه ستون‌ها در یک مرحله + حذف NaN
+            self.df = self.df.assign(**computed).dropna()
+
             return self.df
-            
+
         except Exception as e:
             raise RuntimeError(f"خطا در محاسبه اندیکاتورها: {e}")
     
     def generate_signals(self):
         """تولید سیگنال‌های خرید/فروش"""
         self.calculate_indicators()
-        self.df['signal'] = 0
-        self.df['stop_loss'] = np.nan
-        self.df['entry_price'] = np.nan
-        self.df['trade_type'] = ''
-        
-        position = 0
-        entry_price = 0
-        stop_price = 0
-        
-        for i in range(1, len(self.df)):
-            row = self.df.iloc[i]
-            prev_row = self.df.iloc[i-1]
-            
-            if position == 0:  # بدون پوزیشن
-                # شرط خرید: تقاطع صعودی MACD
-                macd_cross_up = (row['macd'] > row['signal']) and (prev_row['macd'] <= prev_row['signal'])
-                
-                # فیلترهای اضافی
-                histogram_increasing = row['histogram'] > prev_row['histogram']
-                trend_ok = (not self.use_trend_filter) or (row['trend_direction'] == 1)
-                rsi_ok = (row['rsi'] > 30) and (row['rsi'] < 70)  # نه خیلی oversold نه overbought
-                
-                if macd_cross_up and histogram_increasing and trend_ok and rsi_ok:
-                    # ورود خرید
-                    position = 1
-                    entry_price = row['Close'] * (1 + self.slippage)
-                    stop_price = entry_price - (self.atr_multiplier * row['atr'])
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = 1
-                    self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-                    self.df.iloc[i, self.df.columns.get_loc('entry_price')] = entry_price
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = 'BUY'
-            
-            elif position == 1:  # در پوزیشن خرید
-                # شرط خروج
-                macd_cross_down = (row['macd'] < row['signal']) and (prev_row['macd'] >= prev_row['signal'])
-                stop_loss_hit = row['Close'] <= stop_price
-                
-                if macd_cross_down or stop_loss_hit:
-                    position = 0
-                    exit_type = 'STOP' if stop_loss_hit else 'SIGNAL'
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = -1
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = f'SELL_{exit_type}'
-                else:
-                    # Trailing Stop Loss
-                    new_stop = row['Close'] - (self.atr_multiplier * row['atr'])
-                    if new_stop > stop_price:
-                        stop_price = new_stop
-                        self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-        
+
+        # استخراج یک‌باره ستون‌ها به آرایه NumPy (بدون pandas داخل حلقه)
+        n = len(self.df)
+        close = self.df['Close'].to_numpy()
+        macd = self.df['macd'].to_numpy()
+        sig_line = self.df['signal_line'].to_numpy()
+        hist = self.df['histogram'].to_numpy()
+        atr = self.df['atr'].to_numpy()
+        rsi = self.df['rsi'].to_numpy()
+
+        # شرط‌های برداری (یک بار برای کل سری)
+        cross_up = _cross_above(macd, sig_line)
+        cross_down = _cross_above(sig_line, macd)
+        hist_increasing = np.zeros(n, dtype=bool)
+        hist_increasing[1:] = hist[1:] > hist[:-1]
+        rsi_ok = (rsi > 30) & (rsi < 70)  # نه خیلی oversold نه overbought
+
+        if self.use_trend_filter:
+            trend_ok = self.df['trend_direction'].to_numpy() == 1
+        else:
+            trend_ok = np.ones(n, dtype=bool)
+
+        # ماشین حالت باقی‌مانده در کرنل کامپایل‌شده Numba اجرا می‌شود
+        signals, stop_loss, entry_prices, trade_codes, positions = _run_macd_state_machine(
+            close, atr, cross_up, cross_down, hist_increasing, trend_ok, rsi_ok,
+            float(self.atr_multiplier), float(self.slippage)
+        )
+
+        self.df['signal'] = signals
+        self.df['stop_loss'] = stop_loss
+        self.df['entry_price'] = entry_prices
+        self.df['trade_code'] = trade_codes
+        self.df['trade_type'] = [_MACD_TRADE_TYPES[code] for code in trade_codes]
+
+        # پوزیشن هر کندل مستقیماً از ماشین حالت (بدون cumsum/clip بعدی)
+        self._positions = positions
+
         self.signals = self.df['signal'].copy()
         return self.signals
     
-    def backtest(self, initial_capital=10000):
+    def backtest(self, initial_capital=10000, metrics_only=False):
         """بک‌تست کامل با همه جزئیات"""
         try:
             self.generate_signals()
-            
-            # محاسبه position
-            self.df['position'] = self.signals.cumsum().clip(0, 1)
-            
+
+            # کل خط لوله بازده/کارمزد/لغزش در یک گذر NumPy؛
+            # ستون‌ها فقط یک بار در انتها به DataFrame اضافه می‌شوند
+            close = self.df['Close'].to_numpy(dtype=np.float64)
+            atr = self.df['atr'].to_numpy(dtype=np.float64)
+            signal = self.df['signal'].to_numpy()
+
+            # محاسبه position — تابع پله‌ای که خود ماشین حالت ثبت کرده است
+            position = self._positions
+
             # بازده بازار
-            self.df['market_return'] = self.df['Close'].pct_change()
-            
-            # بازده استراتژی
-            self.df['strategy_return'] = self.df['position'].shift(1) * self.df['market_return']
-            
+            market_return = np.empty_like(close)
+            market_return[0] = np.nan
+            market_return[1:] = close[1:] / close[:-1] - 1
+
+            # بازده استراتژی (پوزیشن کندل قبل × بازده بازار)
+            prev_position = np.empty(len(position))
+            prev_position[0] = np.nan
+            prev_position[1:] = position[:-1]
+            strategy_return = prev_position * market_return
+
             # کسر کارمزد
-            self.df['commission'] = abs(self.df['signal']) * self.commission_rate
-            self.df['strategy_return'] -= self.df['commission']
-            
-            # کسر slippage
-            self.df.loc[self.df['signal'] != 0, 'strategy_return'] -= self.slippage
-            
-            # محاسبه position size
-            self.df['position_size'] = (
-                initial_capital * self.risk_per_trade / 
-                (self.atr_multiplier * self.df['atr'])
+            commission = np.abs(signal) * self.commission_rate
+            strategy_return = strategy_return - commission
+
+            # کسر slippage — ضرب ماسک بولی به جای انتساب ایندکس‌دار (بدون شاخه)
+            strategy_return -= self.slippage * (signal != 0)
+
+            # محاسبه position size و نرمالیزاسیون بازده
+            position_size = (
+                initial_capital * self.risk_per_trade /
+                (self.atr_multiplier * atr)
             )
-            
-            # نرمالیزاسیون بازده
-            self.df['strategy_return'] *= (self.df['position_size'] / initial_capital)
-            
-            # محاسبه equity
-            self.df['equity'] = initial_capital * (1 + self.df['strategy_return']).cumprod()
-            
+            strategy_return *= position_size / initial_capital
+
+            if metrics_only:
+                # مسیر سبک برای جستجوی پارامتر / مونت‌کارلو:
+                # بدون ساخت ستون equity؛ افت سرمایه در فضای لگاریتمی با یک گذر
+                log_ret = np.log1p(strategy_return)
+                log_equity = np.nancumsum(log_ret)
+
+                ret_std = np.nanstd(strategy_return, ddof=1)
+                sharpe = (
+                    (np.nanmean(strategy_return) / ret_std) * np.sqrt(252)
+                    if ret_std != 0 else 0
+                )
+                max_dd = np.exp(
+                    np.min(log_equity - np.maximum.accumulate(log_equity))) - 1
+                final_equity = initial_capital * np.exp(log_equity[-1])
+
+                return {
+                    'total_return': (final_equity / initial_capital) - 1,
+                    'sharpe_ratio': sharpe,
+                    'max_drawdown': max_dd,
+                    'final_equity': final_equity,
+                }
+
+            # محاسبه equity (NaN ها مثل cumprod پانداس از ضرب جا می‌افتند)
+            growth = 1 + strategy_return
+            equity = initial_capital * np.cumprod(np.where(np.isnan(growth), 1.0, growth))
+            equity[np.isnan(growth)] = np.nan
+
+            self.df = self.df.assign(
+                position=position,
+                market_return=market_return,
+                strategy_return=strategy_return,
+                commission=commission,
+                position_size=position_size,
+                equity=equity,
+            )
+
             # معیارهای عملکرد
             results = self._calculate_metrics(initial_capital)
-            
+
             return results
-            
+
         except Exception as e:
             print(f"❌ خطا در بک‌تست: {e}")
             return None
     
     def _calculate_metrics(self, initial_capital):
         """محاسبه معیارهای عملکرد"""
-        total_return = (self.df['equity'].iloc[-1] / initial_capital) - 1
-        
-        sharpe = (
-            (self.df['strategy_return'].mean() / self.df['strategy_return'].std()) * np.sqrt(252)
-            if self.df['strategy_return'].std() != 0 else 0
-        )
-        
-        max_dd = ((self.df['equity'] / self.df['equity'].cummax()) - 1).min()
-        
+        # محاسبات اسکالر روی آرایه‌های خام؛ بدون ساخت Series موقت
+        # (توابع nan-aware معادل رفتار skipna در pandas هستند)
+        ret = self.df['strategy_return'].to_numpy()
+        equity = self.df['equity'].to_numpy()
+        signal = self.df['signal'].to_numpy()
+
+        total_return = (equity[-1] / initial_capital) - 1
+
+        ret_std = np.nanstd(ret, ddof=1)
+        sharpe = (np.nanmean(ret) / ret_std) * np.sqrt(252) if ret_std != 0 else 0
+
+        # fmax مقادیر NaN را در بیشینه تجمعی نادیده می‌گیرد (مثل cummax پانداس)
+        max_dd = np.nanmin(equity / np.fmax.accumulate(equity) - 1)
+
+        nonzero_returns = np.count_nonzero(ret != 0)
         win_rate = (
-            (self.df['strategy_return'] > 0).sum() / (self.df['strategy_return'] != 0).sum()
-            if (self.df['strategy_return'] != 0).sum() > 0 else 0
+            np.count_nonzero(ret > 0) / nonzero_returns
+            if nonzero_returns > 0 else 0
         )
-        
-        num_trades = (self.df['signal'] != 0).sum() // 2
-        
-        winning_trades = self.df[self.df['strategy_return'] > 0]['strategy_return']
-        losing_trades = self.df[self.df['strategy_return'] < 0]['strategy_return']
-        
+
+        num_trades = np.count_nonzero(signal) // 2
+
+        winning_trades = ret[ret > 0]
+        losing_trades = ret[ret < 0]
+
         avg_win = winning_trades.mean() if len(winning_trades) > 0 else 0
         avg_loss = losing_trades.mean() if len(losing_trades) > 0 else 0
-        
-        profit_factor = abs(winning_trades.sum() / losing_trades.sum()) if losing_trades.sum() != 0 else 0
-        
-        # تحلیل نوع خروج
-        stop_exits = (self.df['trade_type'].str.contains('STOP', na=False)).sum()
-        signal_exits = (self.df['trade_type'].str.contains('SIGNAL', na=False)).sum()
-        
+
+        losing_sum = losing_trades.sum()
+        profit_factor = abs(winning_trades.sum() / losing_sum) if losing_sum != 0 else 0
+
+        # تحلیل نوع خروج — مقایسه عددی روی کد معامله به جای str.contains
+        trade_code = self.df['trade_code'].to_numpy()
+        stop_exits = int(np.count_nonzero(trade_code == 3))
+        signal_exits = int(np.count_nonzero(trade_code == 2))
+
         return {
             'total_return': total_return,
             'sharpe_ratio': sharpe,
@@ -229,7 +447,7 @@ class MACDMomentumStrategyPro:
             'avg_win': avg_win,
             'avg_loss': avg_loss,
             'profit_factor': profit_factor,
-            'final_equity': self.df['equity'].iloc[-1],
+            'final_equity': equity[-1],
             'total_commission': self.df['commission'].sum() * initial_capital,
             'stop_loss_exits': stop_exits,
             'signal_exits': signal_exits
@@ -0,0 +1,54 @@
+# arb_kernel.py
+# هسته کامپایل‌شده ارزیابی مثلث‌های آربیتراژ
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True, parallel=True, nogil=True)
+def scan_triangles(ask, bid, idx_a, idx_b, idx_c, fee_rate, threshold,
+                   out_idx, out_pct, out_dir):
+    """اسکن همه مثلث‌ها در یک گذر fused و موازی — هر دو جهت
+
+    برای هر مثلث دو حاصل‌ضرب مستقل وجود دارد:
+    γ₁ = bid_c / (ask_a · ask_b) رفت و γ₂ = (bid_a · bid_b) / ask_c
+    برگشت. هر دو در همان prange محاسبه و بیشینه نگه داشته می‌شود
+    (هزینه اضافه ناچیز، بدون اسکن دوم)، سپس ایندکس‌های بالای آستانه در
+    بافرهای از پیش تخصیص‌یافته فشرده می‌شوند.
+
+    Args:
+        ask, bid: آرایه‌های top-of-book هم‌ترتیب با لیست نمادها
+        idx_a, idx_b, idx_c: ایندکس سه پای هر مثلث در آرایه نمادها
+        fee_rate: کارمزد هر معامله (مثلاً 0.001)
+        threshold: حداقل درصد سود
+        out_idx, out_pct, out_dir: بافرهای خروجی به طول تعداد مثلث‌ها؛
+            dir برابر 0 برای رفت و 1 برای برگشت
+
+    Returns:
+        تعداد مثلث‌های سودده نوشته‌شده در بافرها
+    """
+    n = idx_a.size
+    pct = np.empty(n, np.float32)
+    rev = np.empty(n, np.int8)
+    keep = (1.0 - fee_rate) ** 3
+
+    for i in prange(n):
+        gamma_fwd = bid[idx_c[i]] / (ask[idx_a[i]] * ask[idx_b[i]])
+        gamma_rev = (bid[idx_a[i]] * bid[idx_b[i]]) / ask[idx_c[i]]
+        if gamma_rev > gamma_fwd:
+            gamma = gamma_rev
+            rev[i] = 1
+        else:
+            gamma = gamma_fwd
+            rev[i] = 0
+        pct[i] = (gamma * keep - 1.0) * 100.0
+
+    count = 0
+    for i in range(n):
+        # NaN (نماد بدون قیمت) هر دو شرط را رد می‌کند
+        if pct[i] == pct[i] and pct[i] > threshold:
+            out_idx[count] = i
+            out_pct[count] = pct[i]
+            out_dir[count] = rev[i]
+            count += 1
+    return count
@@ -1,8 +1,10 @@
+import functools
+
 import pandas as pd
 import numpy as np
 from statsmodels.tsa.arima.model import ARIMA
 import matplotlib.pyplot as plt
-import arabic_reshaper
+from arabic_reshaper import ArabicReshaper
 from bidi.algorithm import get_display
 
 
@@ -27,26 +29,39 @@ plt.rcParams['axes.unicode_minus'] = False
 # تابع برای فارسی‌سازی متن
 # ========================================
 
+# reshaper یک بار ساخته می‌شه تا هر فراخوانی دوباره تنظیمات رو نخونه
+_RESHAPER = ArabicReshaper(configuration={'delete_harakat': False})
+
+
+@functools.lru_cache(maxsize=256)
 def persian_text(text):
     """
     تبدیل متن فارسی به فرمت قابل نمایش در matplotlib
-    
+
     این تابع دو کار می‌کنه:
     1. حروف رو به هم وصل می‌کنه (reshaping)
     2. جهت متن رو از راست به چپ می‌کنه (bidirectional)
+
+    عنوان‌های تکراری (مثل 'قیمت واقعی') از کش برگردونده می‌شن
     """
-    reshaped_text = arabic_reshaper.reshape(text)
-    bidi_text = get_display(reshaped_text)
-    return bidi_text
+    return get_display(_RESHAPER.reshape(text))
+
 
 
 
 
 
+# خواندن داده قیمت سکه — فقط ستون Close لازمه
+# بار اول xlsx خونده می‌شه و به Parquet تبدیل می‌شه؛
+# اجراهای بعدی مستقیم از Parquet می‌خونن (خیلی سریع‌تر از پارس xlsx)
+import os
 
-# خواندن داده قیمت سکه
-df = pd.read_excel('sekeh_100_days.xlsx')
-prices = df['Close']
+if os.path.exists('sekeh_100_days.parquet'):
+    prices = pd.read_parquet('sekeh_100_days.parquet', columns=['Close'])['Close']
+else:
+    prices = pd.read_excel('sekeh_100_days.xlsx', engine='openpyxl',
+                           usecols=['Close'])['Close']
+    prices.to_frame().to_parquet('sekeh_100_days.parquet')
 
 
 # ⭐ نرمال‌سازی داده (تقسیم بر 1 میلیون)
@@ -60,8 +75,9 @@ print("\n📊 قیمت نرمال شده - محدوده:")
 print(f"   حداقل: {prices_normalized.min():.2f}")
 print(f"   حداکثر: {prices_normalized.max():.2f}")
 # مدل ARIMA(1, 1, 1)
-model = ARIMA(prices_normalized, order=(1, 1, 1))
-fitted_model = model.fit()
+# ورودی ndarray خام به جای Series؛ statsmodels از مسیر ایندکس pandas رد نمی‌شه
+model = ARIMA(prices_normalized.to_numpy(), order=(1, 1, 1))
+fitted_model = model.fit(method='statespace')
 
 # نمایش خلاصه
 print(fitted_model.summary())
@@ -1,6 +1,93 @@
 import pandas as pd
 import numpy as np
 import talib
+from numba import njit
+
+from MACDMomentumStrategyPro import cached_indicator
+
+
+@njit(cache=True, fastmath=True)
+def _run_squeeze_state_machine(close, bb_middle, atr, squeeze_end,
+                               above_upper, below_lower, rsi_ok,
+                               atr_multiplier, slippage):
+    """ماشین حالت ورود/خروج Squeeze روی آرایه‌های خام (کامپایل‌شده با Numba)"""
+    n = close.shape[0]
+    signals = np.zeros(n, dtype=np.int8)
+    stop_loss = np.full(n, np.nan)
+    entry_prices = np.full(n, np.nan)
+    # کد نوع معامله: 0=هیچ, 1=BUY_SQUEEZE, 2=SELL_SQUEEZE, 3=EXIT_MIDDLE, 4=EXIT_STOP
+    trade_codes = np.zeros(n, dtype=np.int8)
+    positions = np.zeros(n, dtype=np.int8)
+
+    position = 0
+    stop_price = 0.0
+    squeeze_ended = False
+
+    for i in range(1, n):
+        # بررسی پایان Squeeze
+        if squeeze_end[i]:
+            squeeze_ended = True
+
+        if position == 0:  # بدون پوزیشن
+
+            # شرط خرید: پایان Squeeze + شکست باند بالا
+            if above_upper[i] and squeeze_ended and rsi_ok[i]:
+                # ورود خرید
+                position = 1
+                entry_price = close[i] * (1 + slippage)
+                stop_price = entry_price - atr_multiplier * atr[i]
+                squeeze_ended = False  # ریست کردن
+
+                signals[i] = 1
+                stop_loss[i] = stop_price
+                entry_prices[i] = entry_price
+                trade_codes[i] = 1
+
+            # شرط فروش: پایان Squeeze + شکست باند پایین
+            elif below_lower[i] and squeeze_ended and rsi_ok[i]:
+                # ورود فروش (Short)
+                position = -1
+                entry_price = close[i] * (1 - slippage)
+                stop_price = entry_price + atr_multiplier * atr[i]
+                squeeze_ended = False
+
+                signals[i] = -1
+                stop_loss[i] = stop_price
+                entry_prices[i] = entry_price
+                trade_codes[i] = 2
+
+        elif position == 1:  # در پوزیشن خرید
+            price_at_middle = close[i] <= bb_middle[i]
+            stop_loss_hit = close[i] <= stop_price
+
+            if price_at_middle or stop_loss_hit:
+                position = 0
+                signals[i] = -1
+                trade_codes[i] = 4 if stop_loss_hit else 3
+            else:
+                # Trailing Stop Loss
+                new_stop = close[i] - atr_multiplier * atr[i]
+                if new_stop > stop_price:
+                    stop_price = new_stop
+                    stop_loss[i] = stop_price
+
+        elif position == -1:  # در پوزیشن فروش
+            price_at_middle = close[i] >= bb_middle[i]
+            stop_loss_hit = close[i] >= stop_price
+
+            if price_at_middle or stop_loss_hit:
+                position = 0
+                signals[i] = 1
+                trade_codes[i] = 4 if stop_loss_hit else 3
+
+        positions[i] = position
+
+    return signals, stop_loss, entry_prices, trade_codes, positions
+
+
+# نگاشت کد عددی نوع معامله به برچسب متنی
+_SQUEEZE_TRADE_TYPES = ('', 'BUY_SQUEEZE', 'SELL_SQUEEZE', 'EXIT_MIDDLE', 'EXIT_STOP')
+
 
 class BollingerSqueezeStrategy:
     def __init__(self, df, bb_period=20, bb_std=2, squeeze_threshold=0.05, 
@@ -15,7 +102,9 @@ class BollingerSqueezeStrategy:
         bb_std : ضریب انحراف معیار (پیش‌فرض 2)
         squeeze_threshold : آستانه تشخیص فشردگی (پیش‌فرض 0.05 = 5%)
         """
-        self.df = df.copy()
+        # بدون copy: محاسبه اندیکاتورها با assign/dropna فریم جدید می‌سازد
+        # و فریم ورودی هرگز in-place تغییر نمی‌کند
+        self.df = df
         self.bb_period = bb_period
         self.bb_std = bb_std
         self.squeeze_threshold = squeeze_threshold
@@ -40,206 +129,226 @@ class BollingerSqueezeStrategy:
         
         if len(self.df) < self.bb_period:
             raise ValueError(f"داده کافی نیست. حداقل {self.bb_period} کندل نیاز است")
+
+        # کاهش دقت ستون‌های قیمتی به float32؛ برای دقت مورد نیاز بک‌تست کافی است
+        # و ترافیک حافظه محاسبات پایین‌دستی را نصف می‌کند
+        price_cols = ['Open', 'High', 'Low', 'Close']
+        self.df = self.df.assign(
+            **{col: self.df[col].astype(np.float32) for col in price_cols})
     
     def calculate_indicators(self):
         """محاسبه Bollinger Bands و اندیکاتورهای کمکی"""
         try:
+            # استخراج یک‌باره آرایه‌های پیوسته float64؛
+            # همه اندیکاتورها از همین بافرها تغذیه می‌شوند (بدون round-trip در pandas)
+            close = np.ascontiguousarray(self.df['Close'].to_numpy(dtype=np.float64))
+            high = np.ascontiguousarray(self.df['High'].to_numpy(dtype=np.float64))
+            low = np.ascontiguousarray(self.df['Low'].to_numpy(dtype=np.float64))
+
             # Bollinger Bands با TA-Lib
-            self.df['bb_upper'], self.df['bb_middle'], self.df['bb_lower'] = talib.BBANDS(
-                self.df['Close'],
+            bb_upper, bb_middle, bb_lower = talib.BBANDS(
+                close,
                 timeperiod=self.bb_period,
                 nbdevup=self.bb_std,
                 nbdevdn=self.bb_std,
                 matype=0
             )
-            
+
+            bb_upper = bb_upper.astype(np.float32)
+            bb_middle = bb_middle.astype(np.float32)
+            bb_lower = bb_lower.astype(np.float32)
+
             # محاسبه عرض باند (Bandwidth)
-            self.df['bandwidth'] = (
-                (self.df['bb_upper'] - self.df['bb_lower']) / self.df['bb_middle']
-            )
-            
-            # تشخیص Squeeze (فشردگی)
-            self.df['is_squeeze'] = self.df['bandwidth'] < self.squeeze_threshold
-            
-            # ATR برای Stop Loss
-            self.df['atr'] = talib.ATR(
-                self.df['High'],
-                self.df['Low'],
-                self.df['Close'],
-                timeperiod=14
-            )
-            
-            # RSI برای فیلتر اضافی
-            self.df['rsi'] = talib.RSI(self.df['Close'], timeperiod=14)
-            
-            # حذف NaN
-            self.df = self.df.dropna()
-            
+            bandwidth = (bb_upper - bb_lower) / bb_middle
+
+            # ATR/RSI مستقل از پارامترهای باند هستند؛ در جستجوی شبکه‌ای کش می‌شوند
+            source_df = self.df
+
+            # افزودن همه ستون‌ها در یک مرحله + حذف NaN
+            self.df = self.df.assign(
+                bb_upper=bb_upper,
+                bb_middle=bb_middle,
+                bb_lower=bb_lower,
+                bandwidth=bandwidth,
+                # تشخیص Squeeze (فشردگی)
+                is_squeeze=bandwidth < self.squeeze_threshold,
+                # ATR برای Stop Loss
+                atr=cached_indicator(
+                    source_df, 'atr', (14,),
+                    lambda: talib.ATR(high, low, close, timeperiod=14).astype(np.float32)),
+                # RSI برای فیلتر اضافی
+                rsi=cached_indicator(
+                    source_df, 'rsi', (14,),
+                    lambda: talib.RSI(close, timeperiod=14).astype(np.float32)),
+            ).dropna()
+
             return self.df
-            
+
         except Exception as e:
             raise RuntimeError(f"خطا در محاسبه اندیکاتورها: {e}")
     
     def generate_signals(self):
         """تولید سیگنال‌های خرید/فروش"""
         self.calculate_indicators()
-        self.df['signal'] = 0
-        self.df['stop_loss'] = np.nan
-        self.df['entry_price'] = np.nan
-        self.df['trade_type'] = ''
-        
-        position = 0
-        entry_price = 0
-        stop_price = 0
-        squeeze_ended = False
-        
-        for i in range(1, len(self.df)):
-            row = self.df.iloc[i]
-            prev_row = self.df.iloc[i-1]
-            
-            # بررسی پایان Squeeze
-            if prev_row['is_squeeze'] and not row['is_squeeze']:
-                squeeze_ended = True
-            
-            if position == 0:  # بدون پوزیشن
-                
-                # شرط خرید: پایان Squeeze + شکست باند بالا
-                breakout_up = (row['Close'] > row['bb_upper']) and squeeze_ended
-                rsi_ok = 30 < row['rsi'] < 70
-                
-                if breakout_up and rsi_ok:
-                    # ورود خرید
-                    position = 1
-                    entry_price = row['Close'] * (1 + self.slippage)
-                    stop_price = entry_price - (self.atr_multiplier * row['atr'])
-                    squeeze_ended = False  # ریست کردن
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = 1
-                    self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-                    self.df.iloc[i, self.df.columns.get_loc('entry_price')] = entry_price
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = 'BUY_SQUEEZE'
-                
-                # شرط فروش: پایان Squeeze + شکست باند پایین
-                breakout_down = (row['Close'] < row['bb_lower']) and squeeze_ended
-                
-                if breakout_down and rsi_ok:
-                    # ورود فروش (Short)
-                    position = -1
-                    entry_price = row['Close'] * (1 - self.slippage)
-                    stop_price = entry_price + (self.atr_multiplier * row['atr'])
-                    squeeze_ended = False
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = -1
-                    self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-                    self.df.iloc[i, self.df.columns.get_loc('entry_price')] = entry_price
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = 'SELL_SQUEEZE'
-            
-            elif position == 1:  # در پوزیشن خرید
-                # شرط خروج: بازگشت به باند میانی یا حد ضرر
-                price_at_middle = row['Close'] <= row['bb_middle']
-                stop_loss_hit = row['Close'] <= stop_price
-                
-                if price_at_middle or stop_loss_hit:
-                    position = 0
-                    exit_type = 'STOP' if stop_loss_hit else 'MIDDLE'
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = -1
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = f'EXIT_{exit_type}'
-                else:
-                    # Trailing Stop Loss
-                    new_stop = row['Close'] - (self.atr_multiplier * row['atr'])
-                    if new_stop > stop_price:
-                        stop_price = new_stop
-                        self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-            
-            elif position == -1:  # در پوزیشن فروش
-                # شرط خروج: بازگشت به باند میانی یا حد ضرر
-                price_at_middle = row['Close'] >= row['bb_middle']
-                stop_loss_hit = row['Close'] >= stop_price
-                
-                if price_at_middle or stop_loss_hit:
-                    position = 0
-                    exit_type = 'STOP' if stop_loss_hit else 'MIDDLE'
-                    
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = 1
-                    self.df.iloc[i, self.df.columns.get_loc('trade_type')] = f'EXIT_{exit_type}'
-        
+
+        # استخراج یک‌باره ستون‌ها به آرایه NumPy (بدون pandas داخل حلقه)
+        n = len(self.df)
+        close = self.df['Close'].to_numpy()
+        bb_upper = self.df['bb_upper'].to_numpy()
+        bb_middle = self.df['bb_middle'].to_numpy()
+        bb_lower = self.df['bb_lower'].to_numpy()
+        is_squeeze = self.df['is_squeeze'].to_numpy()
+        atr = self.df['atr'].to_numpy()
+        rsi = self.df['rsi'].to_numpy()
+
+        # شرط‌های برداری (یک بار برای کل سری)
+        squeeze_end = np.zeros(n, dtype=bool)
+        squeeze_end[1:] = is_squeeze[:-1] & ~is_squeeze[1:]
+        above_upper = close > bb_upper
+        below_lower = close < bb_lower
+        rsi_ok = (rsi > 30) & (rsi < 70)
+
+        # ماشین حالت باقی‌مانده در کرنل کامپایل‌شده Numba اجرا می‌شود
+        signals, stop_loss, entry_prices, trade_codes, positions = _run_squeeze_state_machine(
+            close, bb_middle, atr, squeeze_end, above_upper, below_lower, rsi_ok,
+            float(self.atr_multiplier), float(self.slippage)
+        )
+
+        self.df['signal'] = signals
+        self.df['stop_loss'] = stop_loss
+        self.df['entry_price'] = entry_prices
+        self.df['trade_code'] = trade_codes
+        self.df['trade_type'] = [_SQUEEZE_TRADE_TYPES[code] for code in trade_codes]
+
+        # پوزیشن هر کندل مستقیماً از ماشین حالت (بدون cumsum/clip بعدی)
+        self._positions = positions
+
         self.signals = self.df['signal'].copy()
         return self.signals
     
-    def backtest(self, initial_capital=10000):
+    def backtest(self, initial_capital=10000, metrics_only=False):
         """بک‌تست کامل"""
         try:
             self.generate_signals()
-            
-            # محاسبه position
-            self.df['position'] = self.signals.cumsum().clip(-1, 1)
-            
+
+            # کل خط لوله بازده/کارمزد/لغزش در یک گذر NumPy؛
+            # ستون‌ها فقط یک بار در انتها به DataFrame اضافه می‌شوند
+            close = self.df['Close'].to_numpy(dtype=np.float64)
+            atr = self.df['atr'].to_numpy(dtype=np.float64)
+            signal = self.df['signal'].to_numpy()
+
+            # محاسبه position — تابع پله‌ای که خود ماشین حالت ثبت کرده است
+            position = self._positions
+
             # بازده بازار
-            self.df['market_return'] = self.df['Close'].pct_change()
-            
-            # بازده استراتژی
-            self.df['strategy_return'] = self.df['position'].shift(1) * self.df['market_return']
-            
+            market_return = np.empty_like(close)
+            market_return[0] = np.nan
+            market_return[1:] = close[1:] / close[:-1] - 1
+
+            # بازده استراتژی (پوزیشن کندل قبل × بازده بازار)
+            prev_position = np.empty(len(position))
+            prev_position[0] = np.nan
+            prev_position[1:] = position[:-1]
+            strategy_return = prev_position * market_return
+
             # کسر کارمزد
-            self.df['commission'] = abs(self.df['signal']) * self.commission_rate
-            self.df['strategy_return'] -= self.df['commission']
-            
-            # کسر slippage
-            self.df.loc[self.df['signal'] != 0, 'strategy_return'] -= self.slippage
-            
-            # محاسبه position size
-            self.df['position_size'] = (
-                initial_capital * self.risk_per_trade / 
-                (self.atr_multiplier * self.df['atr'])
+            commission = np.abs(signal) * self.commission_rate
+            strategy_return = strategy_return - commission
+
+            # کسر slippage — ضرب ماسک بولی به جای انتساب ایندکس‌دار (بدون شاخه)
+            strategy_return -= self.slippage * (signal != 0)
+
+            # محاسبه position size و نرمالیزاسیون بازده
+            position_size = (
+                initial_capital * self.risk_per_trade /
+                (self.atr_multiplier * atr)
             )
-            
-            # نرمالیزاسیون بازده
-            self.df['strategy_return'] *= (self.df['position_size'] / initial_capital)
-            
-            # محاسبه equity
-            self.df['equity'] = initial_capital * (1 + self.df['strategy_return']).cumprod()
-            
+            strategy_return *= position_size / initial_capital
+
+            if metrics_only:
+                # مسیر سبک برای جستجوی پارامتر / مونت‌کارلو:
+                # بدون ساخت ستون equity؛ افت سرمایه در فضای لگاریتمی با یک گذر
+                log_ret = np.log1p(strategy_return)
+                log_equity = np.nancumsum(log_ret)
+
+                ret_std = np.nanstd(strategy_return, ddof=1)
+                sharpe = (
+                    (np.nanmean(strategy_return) / ret_std) * np.sqrt(252)
+                    if ret_std != 0 else 0
+                )
+                max_dd = np.exp(
+                    np.min(log_equity - np.maximum.accumulate(log_equity))) - 1
+                final_equity = initial_capital * np.exp(log_equity[-1])
+
+                return {
+                    'total_return': (final_equity / initial_capital) - 1,
+                    'sharpe_ratio': sharpe,
+                    'max_drawdown': max_dd,
+                    'final_equity': final_equity,
+                }
+
+            # محاسبه equity (NaN ها مثل cumprod پانداس از ضرب جا می‌افتند)
+            growth = 1 + strategy_return
+            equity = initial_capital * np.cumprod(np.where(np.isnan(growth), 1.0, growth))
+            equity[np.isnan(growth)] = np.nan
+
+            self.df = self.df.assign(
+                position=position,
+                market_return=market_return,
+                strategy_return=strategy_return,
+                commission=commission,
+                position_size=position_size,
+                equity=equity,
+            )
+
             # معیارهای عملکرد
             results = self._calculate_metrics(initial_capital)
-            
+
             return results
-            
+
         except Exception as e:
             print(f"❌ خطا در بک‌تست: {e}")
             return None
     
     def _calculate_metrics(self, initial_capital):
         """محاسبه معیارهای عملکرد"""
-        total_return = (self.df['equity'].iloc[-1] / initial_capital) - 1
-        
-        sharpe = (
-            (self.df['strategy_return'].mean() / self.df['strategy_return'].std()) * np.sqrt(252)
-            if self.df['strategy_return'].std() != 0 else 0
-        )
-        
-        max_dd = ((self.df['equity'] / self.df['equity'].cummax()) - 1).min()
-        
+        # محاسبات اسکالر روی آرایه‌های خام؛ بدون ساخت Series موقت
+        # (توابع nan-aware معادل رفتار skipna در pandas هستند)
+        ret = self.df['strategy_return'].to_numpy()
+        equity = self.df['equity'].to_numpy()
+        signal = self.df['signal'].to_numpy()
+
+        total_return = (equity[-1] / initial_capital) - 1
+
+        ret_std = np.nanstd(ret, ddof=1)
+        sharpe = (np.nanmean(ret) / ret_std) * np.sqrt(252) if ret_std != 0 else 0
+
+        # fmax مقادیر NaN را در بیشینه تجمعی نادیده می‌گیرد (مثل cummax پانداس)
+        max_dd = np.nanmin(equity / np.fmax.accumulate(equity) - 1)
+
+        nonzero_returns = np.count_nonzero(ret != 0)
         win_rate = (
-            (self.df['strategy_return'] > 0).sum() / (self.df['strategy_return'] != 0).sum()
-            if (self.df['strategy_return'] != 0).sum() > 0 else 0
+            np.count_nonzero(ret > 0) / nonzero_returns
+            if nonzero_returns > 0 else 0
         )
-        
-        num_trades = (self.df['signal'] != 0).sum() // 2
-        
-        winning_trades = self.df[self.df['strategy_return'] > 0]['strategy_return']
-        losing_trades = self.df[self.df['strategy_return'] < 0]['strategy_return']
-        
+
+        num_trades = np.count_nonzero(signal) // 2
+
+        winning_trades = ret[ret > 0]
+        losing_trades = ret[ret < 0]
+
         avg_win = winning_trades.mean() if len(winning_trades) > 0 else 0
         avg_loss = losing_trades.mean() if len(losing_trades) > 0 else 0
-        
-        profit_factor = abs(winning_trades.sum() / losing_trades.sum()) if losing_trades.sum() != 0 else 0
-        
-        # تحلیل نوع خروج
-        squeeze_trades = (self.df['trade_type'].str.contains('SQUEEZE', na=False)).sum()
-        stop_exits = (self.df['trade_type'].str.contains('STOP', na=False)).sum()
-        middle_exits = (self.df['trade_type'].str.contains('MIDDLE', na=False)).sum()
-        
+
+        losing_sum = losing_trades.sum()
+        profit_factor = abs(winning_trades.sum() / losing_sum) if losing_sum != 0 else 0
+
+        # تحلیل نوع خروج — مقایسه عددی روی کد معامله به جای str.contains
+        trade_code = self.df['trade_code'].to_numpy()
+        squeeze_trades = int(np.count_nonzero((trade_code == 1) | (trade_code == 2)))
+        stop_exits = int(np.count_nonzero(trade_code == 4))
+        middle_exits = int(np.count_nonzero(trade_code == 3))
+
         return {
             'total_return': total_return,
             'sharpe_ratio': sharpe,
@@ -249,7 +358,7 @@ class BollingerSqueezeStrategy:
             'avg_win': avg_win,
             'avg_loss': avg_loss,
             'profit_factor': profit_factor,
-            'final_equity': self.df['equity'].iloc[-1],
+            'final_equity': equity[-1],
             'total_commission': self.df['commission'].sum() * initial_capital,
             'squeeze_trades': squeeze_trades,
             'stop_loss_exits': stop_exits,
@@ -1,4 +1,74 @@
+import numpy as np
 import pandas as pd
+from collections import deque
+from numba import njit
+
+
+@njit(cache=True)
+def _breakout_kernel(high, low, close, volume, period, vmult):
+    """هسته fused: مقاومت/حمایت/میانگین حجم + سیگنال و پوزیشن در یک گذر
+
+    بیشینه و کمینه پنجره با دو deque یکنوا (بافر حلقوی به طول period)
+    در O(n) نگه داشته می‌شوند و میانگین حجم با جمع جاری؛ به جای پنج
+    عبور جداگانه از آرایه‌ها فقط یک بار از حافظه رد می‌شویم.
+    """
+    n = high.shape[0]
+    resistance = np.full(n, np.nan)
+    support = np.full(n, np.nan)
+    avgvol = np.full(n, np.nan)
+    signal = np.zeros(n, np.int8)
+    position = np.zeros(n, np.int8)
+
+    maxq = np.empty(period, np.int64)
+    minq = np.empty(period, np.int64)
+    # شمارنده‌های مطلق سر/ته؛ ایندکس واقعی با باقیمانده بر period
+    mh = mt = 0
+    nh = nt = 0
+    vsum = 0.0
+    prev_s = 0
+
+    for i in range(n):
+        # حذف ایندکس‌های خارج از پنجره از سرِ deque
+        if mt > mh and maxq[mh % period] <= i - period:
+            mh += 1
+        if nt > nh and minq[nh % period] <= i - period:
+            nh += 1
+
+        # حفظ یکنوایی: عناصر کوچکتر/بزرگتر از ته حذف می‌شوند
+        while mt > mh and high[maxq[(mt - 1) % period]] <= high[i]:
+            mt -= 1
+        maxq[mt % period] = i
+        mt += 1
+        while nt > nh and low[minq[(nt - 1) % period]] >= low[i]:
+            nt -= 1
+        minq[nt % period] = i
+        nt += 1
+
+        vsum += volume[i]
+        if i >= period:
+            vsum -= volume[i - period]
+
+        if i >= period - 1:
+            r = high[maxq[mh % period]]
+            sup = low[minq[nh % period]]
+            av = vsum / period
+            resistance[i] = r
+            support[i] = sup
+            avgvol[i] = av
+
+            ok = volume[i] > av * vmult
+            s = 0
+            if ok and close[i] > r:
+                s = 1
+            elif ok and close[i] < sup:
+                s = -1
+            signal[i] = s
+            position[i] = s - prev_s
+            prev_s = s
+
+    return resistance, support, avgvol, signal, position
+
+
 class BreakoutStrategy:
     """
     استراتژی شکست (Breakout)
@@ -13,50 +83,116 @@ class BreakoutStrategy:
             period: تعداد کندل برای یافتن حمایت/مقاومت
             volume_multiplier: حداقل حجم نسبت به میانگین (1.5 = 150% حجم معمولی)
         """
-        self.df = df.copy()
+        # بدون copy — ستون‌های جدید با assign اضافه می‌شوند و فریم ورودی دست نمی‌خورد
+        self.df = df
+        # float32 برای حجم کافی است (تا 2^24 بدون خطای نمایش)؛ نصف پهنای باند حافظه
+        if df['volume'].max() < 2 ** 24:
+            self.df = self.df.assign(volume=df['volume'].to_numpy(dtype=np.float32))
         self.period = period
         self.volume_multiplier = volume_multiplier
+
+        # وضعیت جریانی برای update: دو deque یکنوا + جمع جاری حجم
+        self._max_q = deque()   # (ایندکس, high) — سر صف بیشینه پنجره است
+        self._min_q = deque()   # (ایندکس, low) — سر صف کمینه پنجره است
+        self._vol_win = deque()
+        self._vol_sum = 0.0
+        self._tick = 0
+        self._prev_s = 0
         
     def calculate_indicators(self):
-        """محاسبه سطوح حمایت و مقاومت"""
-        # مقاومت = بالاترین قیمت در period اخیر
-        self.df['Resistance'] = self.df['high'].rolling(window=self.period).max()
-        
-        # حمایت = پایین‌ترین قیمت در period اخیر
-        self.df['Support'] = self.df['low'].rolling(window=self.period).min()
-        
-        # میانگین حجم برای تأیید
-        self.df['Avg_Volume'] = self.df['volume'].rolling(window=self.period).mean()
-        
+        """محاسبه سطوح حمایت و مقاومت (و سیگنال‌ها، در همان هسته fused)"""
+        # استخراج یک‌باره آرایه‌های پیوسته؛ کل محاسبه در یک گذر numba
+        high = np.ascontiguousarray(self.df['high'].to_numpy(dtype=np.float64))
+        low = np.ascontiguousarray(self.df['low'].to_numpy(dtype=np.float64))
+        close = np.ascontiguousarray(self.df['close'].to_numpy(dtype=np.float64))
+        volume = np.ascontiguousarray(self.df['volume'].to_numpy(dtype=np.float64))
+
+        resistance, support, avg_volume, signal, position = _breakout_kernel(
+            high, low, close, volume, self.period, self.volume_multiplier)
+
+        # انتساب یک‌جا؛ assign فریم جدید می‌سازد و ورودی کاربر دست‌نخورده می‌ماند
+        self.df = self.df.assign(Resistance=resistance.astype(np.float32),
+                                 Support=support.astype(np.float32),
+                                 Avg_Volume=avg_volume.astype(np.float32),
+                                 Signal=signal, Position=position)
+
         print(f"✅ Support/Resistance({self.period}) و Avg_Volume محاسبه شدند")
         
     def generate_signals(self):
         """تولید سیگنال‌های شکست"""
-        self.df['Signal'] = 0
-        
-        # شرط شکست به بالا: قیمت بالای مقاومت + حجم بالای میانگین
-        breakout_up = (
-            (self.df['close'] > self.df['Resistance']) & 
-            (self.df['volume'] > self.df['Avg_Volume'] * self.volume_multiplier)
-        )
-        self.df.loc[breakout_up, 'Signal'] = 1
-        
-        # شرط شکست به پایین: قیمت پایین حمایت + حجم بالای میانگین
-        breakout_down = (
-            (self.df['close'] < self.df['Support']) & 
-            (self.df['volume'] > self.df['Avg_Volume'] * self.volume_multiplier)
-        )
-        self.df.loc[breakout_down, 'Signal'] = -1
-        
-        # تشخیص تغییر
-        self.df['Position'] = self.df['Signal'].diff()
-        
-        buy_signals = len(self.df[self.df['Position'] == 2])
-        sell_signals = len(self.df[self.df['Position'] == -2])
-        
-        print(f"✅ تعداد شکست‌های صعودی: {buy_signals}")
-        print(f"✅ تعداد شکست‌های نزولی: {sell_signals}")
+        # سیگنال و پوزیشن در هسته fused همراه اندیکاتورها محاسبه شده‌اند
+        if 'Position' not in self.df.columns:
+            self.calculate_indicators()
+
+        position = self.df['Position'].to_numpy()
+        buy_signals = int(np.count_nonzero(position == 2))
+        sell_signals = int(np.count_nonzero(position == -2))
+
+        # یک print به جای دو تا — نصف syscall های stdio
+        print(f"✅ تعداد شکست‌های صعودی: {buy_signals}\n"
+              f"✅ تعداد شکست‌های نزولی: {sell_signals}")
         
+    def update(self, new_bar):
+        """به‌روزرسانی جریانی با کندل جدید (مثلاً از websocket)
+
+        به جای append به فریم و rolling دوباره، بیشینه/کمینه پنجره با
+        دو deque یکنوا و میانگین حجم با جمع جاری نگه داشته می‌شوند؛
+        هزینه هر تیک O(1) سرشکن است.
+
+        Args:
+            new_bar: دیکشنری با کلیدهای high, low, close, volume
+
+        Returns:
+            دیکشنری وضعیت شامل resistance/support/avg_volume/signal/position
+            (مقادیر None تا زمانی که پنجره پر شود)
+        """
+        i = self._tick
+        self._tick += 1
+        high = float(new_bar['high'])
+        low = float(new_bar['low'])
+        close = float(new_bar['close'])
+        volume = float(new_bar['volume'])
+
+        # درج با حفظ یکنوایی؛ عناصر مغلوب از ته صف حذف می‌شوند
+        while self._max_q and self._max_q[-1][1] <= high:
+            self._max_q.pop()
+        self._max_q.append((i, high))
+        if i - self._max_q[0][0] >= self.period:
+            self._max_q.popleft()
+
+        while self._min_q and self._min_q[-1][1] >= low:
+            self._min_q.pop()
+        self._min_q.append((i, low))
+        if i - self._min_q[0][0] >= self.period:
+            self._min_q.popleft()
+
+        # جمع جاری حجم
+        self._vol_win.append(volume)
+        self._vol_sum += volume
+        if len(self._vol_win) > self.period:
+            self._vol_sum -= self._vol_win.popleft()
+
+        if i < self.period - 1:
+            return {'resistance': None, 'support': None, 'avg_volume': None,
+                    'signal': 0, 'position': 0}
+
+        resistance = self._max_q[0][1]
+        support = self._min_q[0][1]
+        avg_volume = self._vol_sum / self.period
+
+        ok = volume > avg_volume * self.volume_multiplier
+        if ok and close > resistance:
+            s = 1
+        elif ok and close < support:
+            s = -1
+        else:
+            s = 0
+        position = s - self._prev_s
+        self._prev_s = s
+
+        return {'resistance': resistance, 'support': support,
+                'avg_volume': avg_volume, 'signal': s, 'position': position}
+
     def get_latest_signal(self):
         """دریافت آخرین سیگنال"""
         last = self.df.iloc[-1]
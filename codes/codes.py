@@ -1,10 +1,18 @@
 # import requests
 # import time
+# from requests.adapters import HTTPAdapter, Retry
+
+# # اتصال پایدار — هندشیک TCP+TLS فقط یک بار انجام می‌شود نه در هر poll
+# _SESSION = requests.Session()
+# _SESSION.mount('https://', HTTPAdapter(
+#     pool_connections=4, pool_maxsize=16,
+#     max_retries=Retry(total=3, backoff_factor=0.2,
+#                       status_forcelist=(429, 500, 502, 503, 504))))
 
 # def get_btc_price_toman():
 #     url = "https://apiv2.nobitex.ir/v3/orderbook/all"
 #     try:
-#         resp = requests.get(url, timeout=10)
+#         resp = _SESSION.get(url, timeout=10)
 #         if resp.status_code == 200:
 #             data = resp.json()
 #             price = int(data["BTCIRT"]["lastTradePrice"])
@@ -25,9 +25,9 @@ ticker2 = Ticker(SYMBOL_2)
 df1 = ticker1.history
 df2 = ticker2.history
 
-# ذخیره
-df1.to_excel(f'{SYMBOL_1}_data.xlsx')
-df2.to_excel(f'{SYMBOL_2}_data.xlsx')
+# ذخیره — Parquet ستونی به جای Excel؛ نوشتن خیلی سریع‌تر و فایل کوچک‌تر
+df1.to_parquet(f'{SYMBOL_1}_data.parquet', engine='pyarrow', compression='zstd')
+df2.to_parquet(f'{SYMBOL_2}_data.parquet', engine='pyarrow', compression='zstd')
 
 print(f"✅ داده {SYMBOL_1}: {len(df1)} روز")
 print(f"✅ داده {SYMBOL_2}: {len(df2)} روز")
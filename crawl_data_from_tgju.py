@@ -6,6 +6,9 @@ import tgju_crawl as tg
 import pandas as pd
 from datetime import datetime, timedelta
 
+# خروجی Excel فقط وقتی لازم است که انسانی بخواهد فایل را باز کند
+EXPORT_XLSX = False
+
 def first_approach():
    
     # دریافت قیمت سکه امامی
@@ -24,9 +27,15 @@ def first_approach():
     print("\nاطلاعات کلی:")
     print(data.info())
     
-    # ذخیره در فایل Excel برای بررسی بیشتر
-    data.to_excel('sekeh_100_days.xlsx', index=False)
-    print("\nداده‌ها در فایل sekeh_100_days.xlsx ذخیره شد!")
+    # ذخیره در Parquet — همان فایلی که arima.py اول سراغش می‌رود
+    data.to_parquet('sekeh_100_days.parquet', engine='pyarrow',
+                    compression='zstd')
+    print("\nداده‌ها در فایل sekeh_100_days.parquet ذخیره شد!")
+
+    if EXPORT_XLSX:
+        # فقط برای بررسی انسانی؛ xlsxwriter ردیف‌ها را استریم می‌کند
+        data.to_excel('sekeh_100_days.xlsx', index=False,
+                      engine='xlsxwriter')
     
     # حالا بر اساس ستون‌های واقعی آمار نمایش بدید
     # فرض می‌کنیم ستون قیمت ممکنه 'p' یا 'price' یا چیز دیگه‌ای باشه
@@ -1,12 +1,72 @@
 import ccxt
 import asyncio
+import numpy as np
 import time
 import logging
 from datetime import datetime
+from numba import njit
+
+# uvloop در صورت نصب بودن جایگزین حلقه پیش‌فرض asyncio می‌شود؛
+# سربار هر await در حلقه مانیتورینگ را به شکل محسوسی کم می‌کند
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(levelname)s - %(message)s')
 
+# جدول‌های کارمزد/زمان انتقال — یک بار در زمان بارگذاری ماژول ساخته می‌شوند
+# تا در مسیر داغ اسکن، هر جفت صرافی دیکشنری تازه نسازد
+_TRADING_FEE = {
+    'binance': 0.001,   # 0.1%
+    'kucoin': 0.001,    # 0.1%
+    'okx': 0.0008,      # 0.08%
+    'bybit': 0.001,     # 0.1%
+    'gate': 0.002,      # 0.2%
+}
+
+# این مقادیر باید از API صرافی دریافت شوند
+_WITHDRAWAL_FEES = {
+    'binance': {'BTC': 0.0005, 'ETH': 0.005, 'USDT': 1},
+    'kucoin': {'BTC': 0.0005, 'ETH': 0.01, 'USDT': 1},
+    'okx': {'BTC': 0.0004, 'ETH': 0.006, 'USDT': 0.8},
+}
+
+_TRANSFER_TIMES = {
+    ('binance', 'kucoin'): 15,
+    ('binance', 'okx'): 10,
+    ('kucoin', 'okx'): 20,
+}
+
+
+@njit(cache=True)
+def _arb_kernel(ask, bid, fee, wfee, inv, thr, out_i, out_j, out_final):
+    """اسکن همه جفت‌های خرید/فروش با حساب کارمزد در یک حلقه بدون تخصیص
+
+    برای تعداد کم صرافی، سربار راه‌اندازی کرنل‌های numpy از خود محاسبه
+    بیشتر است؛ این حلقه فشرده njit شده ایندکس و مقدار نهایی جفت‌های
+    بالای آستانه را در بافرهای از پیش تخصیص‌یافته می‌نویسد.
+    """
+    e = ask.shape[0]
+    count = 0
+    for i in range(e):
+        if np.isnan(ask[i]):
+            continue
+        # مقدار ارز بعد از خرید و برداشت — مستقل از پای فروش
+        amount = (inv / ask[i]) * (1.0 - fee[i]) - wfee[i]
+        for j in range(e):
+            if j == i or np.isnan(bid[j]):
+                continue
+            final = amount * bid[j] * (1.0 - fee[j])
+            if (final - inv) / inv * 100.0 > thr:
+                out_i[count] = i
+                out_j[count] = j
+                out_final[count] = final
+                count += 1
+    return count
+
 class CrossExchangeArbitrageBot:
     def __init__(self, exchanges_config):
         """
@@ -41,12 +101,20 @@ class CrossExchangeArbitrageBot:
 
     async def fetch_ticker_async(self, exchange_id, symbol):
         """دریافت قیمت از یک صرافی به صورت async"""
+        return await self._fetch_one(self.exchanges[exchange_id],
+                                     exchange_id, symbol)
+
+    async def _fetch_one(self, exchange, exchange_id, symbol):
+        """دریافت یک تیکر با شیء صرافیِ از قبل resolve شده"""
         try:
-            exchange = self.exchanges[exchange_id]
             ticker = await exchange.fetch_ticker_async(symbol)
+            # جداسازی ارز پایه/مظنه همین‌جا؛ پایین‌دست دیگر split نمی‌زند
+            base, quote = symbol.split('/')
             return {
                 'exchange': exchange_id,
                 'symbol': symbol,
+                'base': base,
+                'quote': quote,
                 'bid': ticker['bid'],  # بهترین قیمت خرید
                 'ask': ticker['ask'],  # بهترین قیمت فروش
                 'timestamp': ticker['timestamp']
@@ -55,13 +123,39 @@ class CrossExchangeArbitrageBot:
             logging.error(f"Error fetching {symbol} from {exchange_id}: {e}")
             return None
 
+    async def fetch_tickers_async(self, exchange_id, symbols):
+        """دریافت یک‌جای قیمت همه نمادها از یک صرافی در یک درخواست HTTP"""
+        exchange = self.exchanges[exchange_id]
+
+        if exchange.has.get('fetchTickers'):
+            try:
+                tickers = await exchange.fetch_tickers_async(symbols)
+                return [{
+                    'exchange': exchange_id,
+                    'symbol': symbol,
+                    'base': symbol.split('/')[0],
+                    'quote': symbol.split('/')[1],
+                    'bid': tickers[symbol]['bid'],
+                    'ask': tickers[symbol]['ask'],
+                    'timestamp': tickers[symbol]['timestamp']
+                } for symbol in symbols if symbol in tickers]
+            except Exception as e:
+                logging.error(f"Error fetching tickers from {exchange_id}: {e}")
+                return []
+
+        # صرافی‌های بدون fetchTickers: برگشت به درخواست تکی به ازای هر نماد
+        results = await asyncio.gather(
+            *(self._fetch_one(exchange, exchange_id, symbol)
+              for symbol in symbols),
+            return_exceptions=True)
+        return [r for r in results if r and not isinstance(r, Exception)]
+
     async def fetch_all_prices(self, symbol):
         """دریافت قیمت از همه صرافی‌ها به صورت همزمان"""
-        tasks = []
-        for exchange_id in self.exchanges.keys():
-            task = self.fetch_ticker_async(exchange_id, symbol)
-            tasks.append(task)
-        
+        # items() شیء صرافی را همین‌جا می‌دهد؛ lookup دوباره در هر تسک حذف می‌شود
+        tasks = [self._fetch_one(exchange, exchange_id, symbol)
+                 for exchange_id, exchange in self.exchanges.items()]
+
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         # فیلتر کردن نتایج معتبر
@@ -72,100 +166,79 @@ class CrossExchangeArbitrageBot:
     def calculate_arbitrage_profit(self, prices, investment_amount=1000):
         """
         محاسبه سود آربیتراژ برای تمام ترکیبات ممکن صرافی‌ها
+
+        به جای حلقه دوگانه پایتونی، کل ماتریس (E,E) سود با broadcasting
+        در numpy ساخته می‌شود و فقط جفت‌های بالای آستانه دیکشنری می‌گیرند
         """
+        if len(prices) < 2:
+            return []
+
+        # قیمت‌های None با NaN جایگزین می‌شوند تا مقایسه‌ها False شوند
+        ask = np.array([p['ask'] or np.nan for p in prices], dtype=np.float64)
+        bid = np.array([p['bid'] or np.nan for p in prices], dtype=np.float64)
+        # کارمزدها مستقیم از جدول‌های سطح ماژول؛ ارز پایه از فچ کش شده
+        base = prices[0].get('base') or prices[0]['symbol'].split('/')[0]
+        fee = np.fromiter((_TRADING_FEE.get(p['exchange'], 0.002)
+                           for p in prices),
+                          dtype=np.float64, count=len(prices))
+        wfee = np.fromiter(
+            (_WITHDRAWAL_FEES.get(p['exchange'], {}).get(base, 0.0)
+             for p in prices),
+            dtype=np.float64, count=len(prices))
+
+        # حلقه فشرده njit روی همه جفت‌ها؛ فقط بازمانده‌ها دیکشنری می‌گیرند
+        e = len(prices)
+        out_i = np.empty(e * e, dtype=np.int64)
+        out_j = np.empty(e * e, dtype=np.int64)
+        out_final = np.empty(e * e, dtype=np.float64)
+        count = _arb_kernel(ask, bid, fee, wfee,
+                            float(investment_amount),
+                            float(self.min_profit_threshold),
+                            out_i, out_j, out_final)
+
+        # یک بار خواندن ساعت برای کل اسکن؛ نه یک syscall به ازای هر جفت
+        now = datetime.now()
+
         opportunities = []
-        
-        for i, buy_exchange in enumerate(prices):
-            for j, sell_exchange in enumerate(prices):
-                if i >= j:  # جلوگیری از تکرار
-                    continue
-                    
-                # قیمت خرید از صرافی اول (ask price)
-                buy_price = buy_exchange['ask']
-                # قیمت فروش در صرافی دوم (bid price)
-                sell_price = sell_exchange['bid']
-                
-                if not buy_price or not sell_price:
-                    continue
-                
-                # محاسبه مقدار ارز که می‌توان خرید
-                buy_fee = self.get_trading_fee(buy_exchange['exchange'])
-                sell_fee = self.get_trading_fee(sell_exchange['exchange'])
-                withdrawal_fee = self.get_withdrawal_fee(
-                    buy_exchange['exchange'], 
-                    buy_exchange['symbol']
-                )
-                
-                # مقدار ارز بعد از خرید
-                amount_bought = (investment_amount / buy_price) * (1 - buy_fee)
-                
-                # مقدار بعد از انتقال
-                amount_after_withdrawal = amount_bought - withdrawal_fee
-                
-                # مقدار دلار بعد از فروش
-                amount_after_sell = (amount_after_withdrawal * sell_price) * (1 - sell_fee)
-                
-                # محاسبه سود
-                profit = amount_after_sell - investment_amount
-                profit_percent = (profit / investment_amount) * 100
-                
-                # زمان انتقال تقریبی
-                transfer_time = self.estimate_transfer_time(
-                    buy_exchange['exchange'],
-                    sell_exchange['exchange']
-                )
-                
-                if profit_percent > self.min_profit_threshold:
-                    opportunities.append({
-                        'buy_exchange': buy_exchange['exchange'],
-                        'sell_exchange': sell_exchange['exchange'],
-                        'symbol': buy_exchange['symbol'],
-                        'buy_price': buy_price,
-                        'sell_price': sell_price,
-                        'profit_amount': profit,
-                        'profit_percent': profit_percent,
-                        'investment': investment_amount,
-                        'final_amount': amount_after_sell,
-                        'transfer_time': transfer_time,
-                        'timestamp': datetime.now()
-                    })
-        
+        for m in range(count):
+            i = out_i[m]
+            j = out_j[m]
+            final = out_final[m]
+            profit = final - investment_amount
+            buy_exchange = prices[i]
+            sell_exchange = prices[j]
+            opportunities.append({
+                'buy_exchange': buy_exchange['exchange'],
+                'sell_exchange': sell_exchange['exchange'],
+                'symbol': buy_exchange['symbol'],
+                'base': buy_exchange['base'],
+                'quote': buy_exchange['quote'],
+                'buy_price': ask[i],
+                'sell_price': bid[j],
+                'profit_amount': profit,
+                'profit_percent': (profit / investment_amount) * 100,
+                'investment': investment_amount,
+                'final_amount': final,
+                'transfer_time': self.estimate_transfer_time(
+                    buy_exchange['exchange'], sell_exchange['exchange']),
+                'timestamp': now
+            })
+
         return sorted(opportunities, key=lambda x: x['profit_percent'], reverse=True)
 
     def get_trading_fee(self, exchange_id):
         """دریافت کارمزد معاملات"""
-        fee_structure = {
-            'binance': 0.001,   # 0.1%
-            'kucoin': 0.001,    # 0.1%
-            'okx': 0.0008,      # 0.08%
-            'bybit': 0.001,     # 0.1%
-            'gate': 0.002,      # 0.2%
-        }
-        return fee_structure.get(exchange_id, 0.002)
+        return _TRADING_FEE.get(exchange_id, 0.002)
 
     def get_withdrawal_fee(self, exchange_id, symbol):
         """دریافت کارمزد برداشت"""
-        # این مقادیر باید از API صرافی دریافت شوند
         base_currency = symbol.split('/')[0]
-        
-        withdrawal_fees = {
-            'binance': {'BTC': 0.0005, 'ETH': 0.005, 'USDT': 1},
-            'kucoin': {'BTC': 0.0005, 'ETH': 0.01, 'USDT': 1},
-            'okx': {'BTC': 0.0004, 'ETH': 0.006, 'USDT': 0.8},
-        }
-        
-        return withdrawal_fees.get(exchange_id, {}).get(base_currency, 0)
+        return _WITHDRAWAL_FEES.get(exchange_id, {}).get(base_currency, 0)
 
     def estimate_transfer_time(self, from_exchange, to_exchange):
         """تخمین زمان انتقال بین صرافی‌ها (به دقیقه)"""
-        transfer_times = {
-            ('binance', 'kucoin'): 15,
-            ('binance', 'okx'): 10,
-            ('kucoin', 'okx'): 20,
-        }
-        
         key = (from_exchange, to_exchange)
-        return transfer_times.get(key, 30)  # پیش‌فرض 30 دقیقه
+        return _TRANSFER_TIMES.get(key, 30)  # پیش‌فرض 30 دقیقه
     
 
 
@@ -177,13 +250,17 @@ class CrossExchangeArbitrageBot:
             buy_exchange_id = opportunity['buy_exchange']
             sell_exchange_id = opportunity['sell_exchange']
             symbol = opportunity['symbol']
+            # پایه/مظنه از خود فرصت — بدون split دوباره در هر مرحله
+            base = opportunity.get('base') or symbol.split('/')[0]
+            quote = opportunity.get('quote') or symbol.split('/')[1]
             investment = opportunity['investment']
             
             # مرحله 1: بررسی موجودی
             balance_check = await self.check_balances(
                 buy_exchange_id, 
                 sell_exchange_id, 
-                symbol,
+                base,
+                quote,
                 investment
             )
             
@@ -209,7 +286,7 @@ class CrossExchangeArbitrageBot:
             withdrawal = await self.withdraw_crypto(
                 buy_exchange_id,
                 sell_exchange_id,
-                symbol,
+                base,
                 buy_order['filled']
             )
             
@@ -220,7 +297,7 @@ class CrossExchangeArbitrageBot:
                 return None
             
             # مرحله 4: منتظر تایید انتقال
-            await self.wait_for_deposit(sell_exchange_id, symbol, buy_order['filled'])
+            await self.wait_for_deposit(sell_exchange_id, base, buy_order['filled'])
             
             # مرحله 5: فروش در صرافی دوم
             sell_order = await self.place_market_order(
@@ -268,17 +345,17 @@ class CrossExchangeArbitrageBot:
             logging.error(f"Error placing order: {e}")
             return None
 
-    async def withdraw_crypto(self, from_exchange_id, to_exchange_id, symbol, amount):
+    async def withdraw_crypto(self, from_exchange_id, to_exchange_id, base_currency, amount):
         """انتقال ارز بین صرافی‌ها"""
         try:
             # دریافت آدرس واریز صرافی مقصد
             to_exchange = self.exchanges[to_exchange_id]
-            deposit_address = await to_exchange.fetch_deposit_address_async(symbol.split('/')[0])
+            deposit_address = await to_exchange.fetch_deposit_address_async(base_currency)
             
             # انجام برداشت از صرافی مبدا
             from_exchange = self.exchanges[from_exchange_id]
             withdrawal = await from_exchange.withdraw_async(
-                symbol.split('/')[0],
+                base_currency,
                 amount,
                 deposit_address['address'],
                 tag=deposit_address.get('tag'),
@@ -292,10 +369,9 @@ class CrossExchangeArbitrageBot:
             logging.error(f"Withdrawal error: {e}")
             return None
 
-    async def wait_for_deposit(self, exchange_id, symbol, expected_amount, timeout=3600):
+    async def wait_for_deposit(self, exchange_id, base_currency, expected_amount, timeout=3600):
         """منتظر واریز در صرافی مقصد"""
         start_time = time.time()
-        base_currency = symbol.split('/')[0]
         
         while time.time() - start_time < timeout:
             try:
@@ -328,27 +404,47 @@ class CrossExchangeArbitrageBot:
         
         while True:
             try:
+                # یک درخواست bulk به ازای هر صرافی (E درخواست به جای E×S)
+                # و gather همه با هم تا رفت‌وبرگشت‌ها هم‌پوشان شوند
+                tasks = [self.fetch_tickers_async(exchange_id, symbols)
+                         for exchange_id in self.exchanges.keys()]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                # گروه‌بندی نتایج معتبر بر اساس نماد
+                prices_by_symbol = {symbol: [] for symbol in symbols}
+                for exchange_results in results:
+                    if isinstance(exchange_results, Exception):
+                        continue
+                    for r in exchange_results:
+                        prices_by_symbol[r['symbol']].append(r)
+
                 for symbol in symbols:
-                    # دریافت قیمت‌ها از همه صرافی‌ها
-                    prices = await self.fetch_all_prices(symbol)
-                    
+                    prices = prices_by_symbol[symbol]
+
                     if len(prices) < 2:
                         continue
-                    
+
                     # محاسبه فرصت‌های آربیتراژ
                     opportunities = self.calculate_arbitrage_profit(prices, investment_amount=1000)
-                    
+
                     # نمایش بهترین فرصت
                     if opportunities:
                         best = opportunities[0]
-                        logging.info(f"""
-                        🎯 Arbitrage Opportunity Found!
-                        Symbol: {best['symbol']}
-                        Buy: {best['buy_exchange']} @ ${best['buy_price']:.2f}
-                        Sell: {best['sell_exchange']} @ ${best['sell_price']:.2f}
-                        Profit: {best['profit_percent']:.2f}% (${best['profit_amount']:.2f})
-                        Transfer Time: ~{best['transfer_time']} min
-                        """)
+                        # فرمت %s تنبل است — اگر سطح INFO خاموش باشد
+                        # هیچ رشته‌ای ساخته نمی‌شود
+                        logging.info(
+                            "\n"
+                            "🎯 Arbitrage Opportunity Found!\n"
+                            "Symbol: %s\n"
+                            "Buy: %s @ $%.2f\n"
+                            "Sell: %s @ $%.2f\n"
+                            "Profit: %.2f%% ($%.2f)\n"
+                            "Transfer Time: ~%s min",
+                            best['symbol'],
+                            best['buy_exchange'], best['buy_price'],
+                            best['sell_exchange'], best['sell_price'],
+                            best['profit_percent'], best['profit_amount'],
+                            best['transfer_time'])
                         
                         # ارسال نوتیفیکیشن
                         await self.send_notification(best)
@@ -368,7 +464,7 @@ class CrossExchangeArbitrageBot:
                 await asyncio.sleep(10)
 
 
-    async def check_balances(self, buy_exchange_id, sell_exchange_id, symbol, amount):
+    async def check_balances(self, buy_exchange_id, sell_exchange_id, base_currency, quote_currency, amount):
         """بررسی موجودی در هر دو صرافی"""
         try:
             buy_exchange = self.exchanges[buy_exchange_id]
@@ -377,13 +473,10 @@ class CrossExchangeArbitrageBot:
             buy_balance = await buy_exchange.fetch_balance_async()
             sell_balance = await sell_exchange.fetch_balance_async()
             
-            quote_currency = symbol.split('/')[1]  # معمولاً USDT
-            base_currency = symbol.split('/')[0]   # مثلاً BTC
-            
-            # بررسی موجودی برای خرید
+            # بررسی موجودی برای خرید (مظنه، معمولاً USDT)
             available_for_buy = buy_balance['free'].get(quote_currency, 0)
             
-            # بررسی اینکه آیا در صرافی فروش جای واریز هست
+            # بررسی اینکه آیا در صرافی فروش جای واریز هست (ارز پایه)
             available_for_sell = sell_balance['free'].get(base_currency, 0)
             
             sufficient = available_for_buy >= amount
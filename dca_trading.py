@@ -3,6 +3,8 @@ DCA Trading Bot - Dollar Cost Averaging Strategy
 نسخه حرفه‌ای و کامل"""
 import ccxt
 import schedule
+import threading
+import queue
 import time
 import logging
 import json
@@ -13,6 +15,13 @@ from telegram.error import TelegramError
 import sqlite3
 
 class DCABot:
+    # رشته SQL یک بار تعریف می‌شود تا در هر فراخوانی همان شیء literal به
+    # sqlite برسد و از statement cache داخلی اتصال استفاده شود
+    _INSERT_SQL = '''
+        INSERT INTO orders (timestamp, symbol, amount, price, total_cost, status, order_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+
     def __init__(self, config_path='config.json'):
         """راه‌اندازی اولیه بات"""
         self.config = self.load_config(config_path)
@@ -21,6 +30,12 @@ class DCABot:
         self.chat_id = self.config['telegram_chat_id']
         self.setup_logging()
         self.setup_database()
+        # کش قیمت با TTL کوتاه: نماد -> (زمان، قیمت)
+        self._price_cache = {}
+        self._price_ttl = self.config.get('price_cache_ttl', 10)
+        # ارسال تلگرام در ترد پس‌زمینه تا I/O شبکه چرخه اصلی را بلاک نکند
+        self._tg_queue = queue.Queue()
+        threading.Thread(target=self._telegram_worker, daemon=True).start()
         
     def load_config(self, config_path):
         """بارگذاری تنظیمات از فایل"""
@@ -56,9 +71,22 @@ class DCABot:
         self.logger = logging.getLogger(__name__)
         
     def setup_database(self):
-        """ایجاد دیتابیس برای ذخیره تاریخچه"""
-        conn = sqlite3.connect('dca_history.db')
-        cursor = conn.cursor()
+        """ایجاد دیتابیس و اتصال پایدار برای ذخیره تاریخچه
+
+        یک اتصال بلندمدت با WAL به جای connect/close در هر کوئری؛
+        هزینه راه‌اندازی اتصال و fsync ژورنال پیش‌فرض از خود کوئری‌های
+        کوچک ما بیشتر بود.
+        """
+        self.conn = sqlite3.connect('dca_history.db', isolation_level=None,
+                                    check_same_thread=False)
+        # قفل برای جاب‌های schedule که ممکن است همزمان اجرا شوند
+        self.db_lock = threading.Lock()
+
+        cursor = self.conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA busy_timeout=5000')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS orders (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -71,48 +99,90 @@ class DCABot:
                 order_id TEXT
             )
         ''')
-        conn.commit()
-        conn.close()
+        # ایندکس ترکیبی برای تجمیع‌ها؛ بدون آن با بزرگ شدن تاریخچه
+        # هر SUM/MIN/MAX یک full scan می‌شود
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_orders_symbol_status
+            ON orders(symbol, status)
+        ''')
+
+    def close_database(self):
+        """بستن اتصال دیتابیس هنگام توقف بات
+
+        PRAGMA optimize قبل از close آمار planner را تازه نگه می‌دارد تا
+        کوئری‌های تجمیعی با بزرگ شدن جدول روی ایندکس بمانند
+        """
+        if getattr(self, 'conn', None) is not None:
+            with self.db_lock:
+                self.conn.execute('PRAGMA optimize')
+                self.conn.close()
+            self.conn = None
+
+    def analyze_database(self):
+        """به‌روزرسانی هفتگی آمار stat1 برای query planner"""
+        with self.db_lock:
+            self.conn.execute('ANALYZE orders')
         
     def get_current_price(self, symbol):
-        """دریافت قیمت فعلی"""
+        """دریافت قیمت فعلی (با کش TTL کوتاه)
+
+        فراخوانی‌های پشت‌سرهم در یک چرخه گزارش/خرید به جای REST دوباره
+        از کش جواب می‌گیرند؛ TTL با config['price_cache_ttl'] قابل تنظیم است
+        """
+        cached = self._price_cache.get(symbol)
+        if cached and time.monotonic() - cached[0] < self._price_ttl:
+            return cached[1]
+
         try:
             ticker = self.exchange.fetch_ticker(symbol)
-            return ticker['last']
+            price = ticker['last']
+            self._price_cache[symbol] = (time.monotonic(), price)
+            return price
         except Exception as e:
             self.logger.error(f"خطا در دریافت قیمت: {e}")
             return None
             
     def save_order_to_db(self, order_data):
         """ذخیره سفارش در دیتابیس"""
-        conn = sqlite3.connect('dca_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO orders (timestamp, symbol, amount, price, total_cost, status, order_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            order_data['timestamp'],
-            order_data['symbol'],
-            order_data['amount'],
-            order_data['price'],
-            order_data['total_cost'],
-            order_data['status'],
-            order_data['order_id']
-        ))
-        conn.commit()
-        conn.close()
+        with self.db_lock:
+            self.conn.execute(self._INSERT_SQL, (
+                order_data['timestamp'],
+                order_data['symbol'],
+                order_data['amount'],
+                order_data['price'],
+                order_data['total_cost'],
+                order_data['status'],
+                order_data['order_id']
+            ))
         
+    def save_orders_batch(self, order_dicts):
+        """ذخیره دسته‌ای سفارش‌ها در یک تراکنش
+
+        برای ایمپورت تاریخچه یا هر مسیر bulk — کل دسته یک BEGIN/COMMIT
+        می‌گیرد تا fsync یک بار به ازای تراکنش انجام شود نه هر ردیف
+        """
+        rows = [(o['timestamp'], o['symbol'], o['amount'], o['price'],
+                 o['total_cost'], o['status'], o['order_id'])
+                for o in order_dicts]
+
+        with self.db_lock:
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self.conn.executemany(self._INSERT_SQL, rows)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
     def calculate_average_price(self, symbol):
         """محاسبه قیمت میانگین خرید"""
-        conn = sqlite3.connect('dca_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT SUM(amount), SUM(total_cost) 
-            FROM orders 
-            WHERE symbol = ? AND status = 'completed'
-        ''', (symbol,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db_lock:
+            cursor = self.conn.execute('''
+                SELECT SUM(amount), SUM(total_cost) 
+                FROM orders 
+                WHERE symbol = ? AND status = 'completed'
+            ''', (symbol,))
+            result = cursor.fetchone()
         
         if result[0] and result[1]:
             total_amount = result[0]
@@ -121,11 +191,23 @@ class DCABot:
         return 0
         
     def send_telegram_message(self, message):
-        """ارسال پیام به تلگرام"""
-        try:
-            self.bot.send_message(chat_id=self.chat_id, text=message)
-        except TelegramError as e:
-            self.logger.error(f"خطا در ارسال پیام تلگرام: {e}")
+        """ارسال پیام به تلگرام (غیرمسدودکننده)
+
+        پیام فقط در صف گذاشته می‌شود؛ POST واقعی در ترد پس‌زمینه انجام
+        می‌شود تا تأخیر شبکه تلگرام روی خرید/ذخیره DCA اثر نگذارد
+        """
+        self._tg_queue.put(message)
+
+    def _telegram_worker(self):
+        """ترد پس‌زمینه: مصرف صف پیام‌ها و ارسال واقعی به تلگرام"""
+        while True:
+            message = self._tg_queue.get()
+            try:
+                self.bot.send_message(chat_id=self.chat_id, text=message)
+            except TelegramError as e:
+                self.logger.error(f"خطا در ارسال پیام تلگرام: {e}")
+            finally:
+                self._tg_queue.task_done()
             
     def execute_dca_buy(self):
         """اجرای خرید DCA"""
@@ -189,51 +271,62 @@ Order ID: {order['id']}
             self.send_telegram_message(error_msg)
             
     def get_portfolio_stats(self):
-        """دریافت آمار پورتفولیو"""
-        conn = sqlite3.connect('dca_history.db')
-        cursor = conn.cursor()
-        
+        """دریافت آمار پورتفولیو
+
+        یک کوئری GROUP BY برای همه نمادها به جای یک کوئری تجمیعی به
+        ازای هر نماد (الگوی N+1)
+        """
         stats = {}
-        for symbol in set([self.config['symbol']]):
-            cursor.execute('''
+        with self.db_lock:
+            cursor = self.conn.execute('''
                 SELECT 
+                    symbol,
                     COUNT(*), 
                     SUM(amount), 
                     SUM(total_cost),
                     MIN(price),
                     MAX(price)
                 FROM orders 
-                WHERE symbol = ? AND status = 'completed'
-            ''', (symbol,))
-            
-            result = cursor.fetchone()
-            if result[0]:
-                stats[symbol] = {
-                    'total_purchases': result[0],
-                    'total_amount': result[1],
-                    'total_invested': result[2],
-                    'min_price': result[3],
-                    'max_price': result[4],
-                    'avg_price': result[2] / result[1] if result[1] else 0
-                }
-        
-        conn.close()
+                WHERE status = 'completed'
+                GROUP BY symbol
+            ''')
+            rows = cursor.fetchall()
+
+        for symbol, count, amount, cost, pmin, pmax in rows:
+            stats[symbol] = {
+                'total_purchases': count,
+                'total_amount': amount,
+                'total_invested': cost,
+                'min_price': pmin,
+                'max_price': pmax,
+                'avg_price': cost / amount if amount else 0
+            }
+
         return stats
         
     def send_daily_report(self):
         """ارسال گزارش روزانه"""
         stats = self.get_portfolio_stats()
+
+        # تجمیع قطعات و یک join به جای += در حلقه (رشد درجه دوم رشته)
+        parts = ["📊 گزارش روزانه DCA Bot\n\n"]
         
-        report = "📊 گزارش روزانه DCA Bot\n\n"
-        
+        # یک فراخوانی bulk برای همه نمادها به جای fetch_ticker در حلقه
+        try:
+            tickers = self.exchange.fetch_tickers(list(stats.keys()))
+        except Exception as e:
+            self.logger.error(f"خطا در دریافت قیمت‌ها: {e}")
+            tickers = {}
+
         for symbol, data in stats.items():
-            current_price = self.get_current_price(symbol)
+            ticker = tickers.get(symbol)
+            current_price = ticker['last'] if ticker else None
             if current_price:
                 current_value = data['total_amount'] * current_price
                 profit_loss = current_value - data['total_invested']
                 profit_loss_pct = (profit_loss / data['total_invested']) * 100
                 
-                report += f"""
+                parts.append(f"""
 نماد: {symbol}
 تعداد خرید: {data['total_purchases']}
 مقدار کل: {data['total_amount']:.8f}
@@ -243,9 +336,9 @@ Order ID: {order['id']}
 قیمت میانگین: ${data['avg_price']:,.2f}
 قیمت فعلی: ${current_price:,.2f}
 محدوده قیمت: ${data['min_price']:,.2f} - ${data['max_price']:,.2f}
-                """
-        
-        self.send_telegram_message(report)
+                """)
+
+        self.send_telegram_message(''.join(parts))
         
     def start(self):
         """شروع بات"""
@@ -264,6 +357,9 @@ Order ID: {order['id']}
             
         # گزارش روزانه
         schedule.every().day.at("20:00").do(self.send_daily_report)
+
+        # آمار planner هفتگی (ساعت کم‌ترافیک)
+        schedule.every().sunday.at("03:00").do(self.analyze_database)
         
         # پیام شروع
         start_msg = f"""
@@ -278,14 +374,22 @@ Order ID: {order['id']}
         self.logger.info(start_msg)
         self.send_telegram_message(start_msg)
         
-        # حلقه اصلی
+        # حلقه اصلی — خواب دقیقاً تا جاب بعدی به جای بیدار شدن هر دقیقه
+        # (سقف ۶۰ ثانیه تا KeyboardInterrupt بی‌پاسخ نماند)
         while True:
             try:
+                idle = schedule.idle_seconds()
+                if idle is None:
+                    idle = 60
+                if idle > 0:
+                    time.sleep(min(idle, 60))
                 schedule.run_pending()
-                time.sleep(60)
             except KeyboardInterrupt:
                 self.logger.info("بات متوقف شد")
                 self.send_telegram_message("⏹ DCA Bot متوقف شد")
+                # تخلیه صف تلگرام قبل از خروج تا پیام توقف گم نشود
+                self._tg_queue.join()
+                self.close_database()
                 break
             except Exception as e:
                 self.logger.error(f"خطای غیرمنتظره: {e}")
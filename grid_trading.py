@@ -58,25 +58,45 @@ def main():
     # قرار دادن سفارشات orders = place_orders(exchange, symbol, grid_levels, base_order_size)
 
     # حلقه اصلی while True:
-    for order in orders[:]:
+    # یک فراخوانی bulk برای وضعیت همه سفارش‌ها به جای fetch_order تکی
+    # در هر دور (الگوی N+1 و فشار rate limit)
+    try:
+        order_status_by_id = {o['id']: o
+                              for o in exchange.fetch_orders(symbol)}
+    except Exception as e:
+        logging.error(f"Error fetching orders: {e}")
+        order_status_by_id = {}
+
+    # بازسازی لیست بازمانده‌ها در یک گذر به جای orders.remove تکی
+    # (حذف از وسط لیست O(n) است و کل چرخه را O(n²) می‌کرد)
+    survivors = []
+    new_orders = []
+    for order in orders:
         try:
-            order_status = exchange.fetch_order(order['id'], symbol)
+            order_status = order_status_by_id.get(order['id'])
+            if order_status is None:
+                survivors.append(order)
+                continue
             if order_status['status'] == 'closed':
                 logging.info(f"Order filled: {order_status['side']} at {order_status['price']}")
-                # قرار دادن سفارش جدید در سطح مجاور if order_status['side'] == 'buy':
-                new_price = order_status['price'] + grid_size 
-                new_order = exchange.create_limit_order(symbol, 'sell', base_order_size, new_price)
-                orders.append(new_order)
-                logging.info(f"New sell order placed at {new_price}")
-            elif order_status['side'] == 'sell':
-                new_price = order_status['price'] - grid_size 
-                new_order = exchange.create_limit_order(symbol, 'buy', base_order_size, new_price)
-                orders.append(new_order)
-                logging.info(f"New buy order placed at {new_price}")
-                orders.remove(order)
+                # قرار دادن سفارش جدید در سطح مجاور
+                if order_status['side'] == 'buy':
+                    new_price = order_status['price'] + grid_size
+                    new_order = exchange.create_limit_order(symbol, 'sell', base_order_size, new_price)
+                    new_orders.append(new_order)
+                    logging.info(f"New sell order placed at {new_price}")
+                elif order_status['side'] == 'sell':
+                    new_price = order_status['price'] - grid_size
+                    new_order = exchange.create_limit_order(symbol, 'buy', base_order_size, new_price)
+                    new_orders.append(new_order)
+                    logging.info(f"New buy order placed at {new_price}")
+            else:
+                survivors.append(order)
         except Exception as e:
             logging.error(f"Error processing order {order['id']}: {e}")
+            survivors.append(order)
             time.sleep(sleep_time)
+    orders = survivors + new_orders
 
 if __name__ == "__main__":
  main()
@@ -1,6 +1,384 @@
 # indicators.py
 
+import hashlib
+import warnings
+
+import numpy as np
 import pandas as pd
+from numba import njit
+
+
+@njit(cache=True)
+def _ewm(x, alpha):
+    """EWM mean via its scalar recurrence (adjust=False semantics)."""
+    out = np.empty_like(x)
+    s = x[0]
+    out[0] = s
+    for i in range(1, x.size):
+        s = alpha * x[i] + (1.0 - alpha) * s
+        out[i] = s
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def _fused_close_kernel(close, fast, slow, signal, bb_length, rsi_length):
+    """Single pass over close computing EMA/MACD, SMA/std and RSI state.
+
+    Each indicator alone is already C-level, so the remaining win is
+    streaming the close array through memory once instead of once per
+    indicator: EMAs via their recurrence, rolling mean/std via ring-buffer
+    running sums, RSI via running gain/loss sums.
+    """
+    n = close.shape[0]
+    ema_fast = np.empty(n)
+    ema_slow = np.empty(n)
+    macd = np.empty(n)
+    macd_signal = np.empty(n)
+    sma = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    rsi = np.full(n, np.nan)
+
+    alpha_fast = 2.0 / (fast + 1)
+    alpha_slow = 2.0 / (slow + 1)
+    alpha_sig = 2.0 / (signal + 1)
+
+    ring_bb = np.zeros(bb_length)
+    bsum = 0.0
+    bsumsq = 0.0
+    ring_gain = np.zeros(rsi_length)
+    ring_loss = np.zeros(rsi_length)
+    gsum = 0.0
+    lsum = 0.0
+
+    ef = close[0]
+    es = close[0]
+    sg = 0.0
+    prev = close[0]
+
+    for i in range(n):
+        x = close[i]
+
+        # EMA recurrences (adjust=False semantics, seeded on first value)
+        if i > 0:
+            ef = alpha_fast * x + (1.0 - alpha_fast) * ef
+            es = alpha_slow * x + (1.0 - alpha_slow) * es
+        m = ef - es
+        if i == 0:
+            sg = m
+        else:
+            sg = alpha_sig * m + (1.0 - alpha_sig) * sg
+        ema_fast[i] = ef
+        ema_slow[i] = es
+        macd[i] = m
+        macd_signal[i] = sg
+
+        # rolling mean/std over a ring buffer (ddof=1 like pandas)
+        j = i % bb_length
+        if i >= bb_length:
+            old = ring_bb[j]
+            bsum -= old
+            bsumsq -= old * old
+        ring_bb[j] = x
+        bsum += x
+        bsumsq += x * x
+        if i >= bb_length - 1:
+            mean = bsum / bb_length
+            var = (bsumsq - bsum * bsum / bb_length) / (bb_length - 1)
+            sma[i] = mean
+            std[i] = np.sqrt(var) if var > 0.0 else 0.0
+
+        # RSI running gain/loss sums over the last rsi_length deltas
+        if i > 0:
+            delta = x - prev
+            g = delta if delta > 0.0 else 0.0
+            l = -delta if delta < 0.0 else 0.0
+            k = (i - 1) % rsi_length
+            if i - 1 >= rsi_length:
+                gsum -= ring_gain[k]
+                lsum -= ring_loss[k]
+            ring_gain[k] = g
+            ring_loss[k] = l
+            gsum += g
+            lsum += l
+            if i >= rsi_length:
+                if lsum > 0.0:
+                    rsi[i] = 100.0 - 100.0 / (1.0 + gsum / lsum)
+                elif gsum > 0.0:
+                    rsi[i] = 100.0
+        prev = x
+
+    return ema_fast, ema_slow, macd, macd_signal, sma, std, rsi
+
+
+@njit(cache=True, fastmath=True)
+def rolling_mean(x, w):
+    """Rolling mean via a running sum: one add + one subtract per step,
+    instead of pandas materializing each window."""
+    n = x.size
+    out = np.full(n, np.nan)
+    s = 0.0
+    for i in range(n):
+        s += x[i]
+        if i >= w:
+            s -= x[i - w]
+        if i >= w - 1:
+            out[i] = s / w
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def rolling_mean_std(x, w):
+    """Rolling mean and sample std (ddof=1) from running sum/sum-of-squares."""
+    n = x.size
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    s = 0.0
+    s2 = 0.0
+    for i in range(n):
+        v = x[i]
+        s += v
+        s2 += v * v
+        if i >= w:
+            old = x[i - w]
+            s -= old
+            s2 -= old * old
+        if i >= w - 1:
+            mean[i] = s / w
+            var = (s2 - s * s / w) / (w - 1)
+            std[i] = np.sqrt(var) if var > 0.0 else 0.0
+    return mean, std
+
+
+@njit(cache=True, fastmath=True)
+def rolling_atr(high, low, close, w):
+    """ATR as a w-period simple mean of true range, fused in one pass.
+
+    True range and its running sum live in the same loop, so no
+    intermediate high-low/high-close/low-close arrays are allocated.
+    The first bar has no previous close and stays NaN, as does the
+    window warm-up.
+    """
+    n = high.size
+    out = np.full(n, np.nan)
+    ring = np.zeros(w)
+    s = 0.0
+    for i in range(1, n):
+        tr = high[i] - low[i]
+        hc = abs(high[i] - close[i - 1])
+        if hc > tr:
+            tr = hc
+        lc = abs(low[i] - close[i - 1])
+        if lc > tr:
+            tr = lc
+        j = (i - 1) % w
+        if i - 1 >= w:
+            s -= ring[j]
+        ring[j] = tr
+        s += tr
+        if i >= w:
+            out[i] = s / w
+    return out
+
+
+@njit(cache=True)
+def _rolling_high_low(high, low, windows):
+    """Rolling max of high and min of low for several window sizes.
+
+    One monotonic ring-buffer deque pair per window gives amortised O(1)
+    per element, so Ichimoku/Stochastic/Fibonacci share this instead of
+    separate pandas rolling passes per window length.
+    """
+    n = high.shape[0]
+    m = windows.shape[0]
+    hmax = np.full((m, n), np.nan)
+    lmin = np.full((m, n), np.nan)
+
+    for k in range(m):
+        w = windows[k]
+        maxq = np.empty(w, np.int64)
+        minq = np.empty(w, np.int64)
+        mh = mt = 0
+        nh = nt = 0
+        for i in range(n):
+            if mt > mh and maxq[mh % w] <= i - w:
+                mh += 1
+            if nt > nh and minq[nh % w] <= i - w:
+                nh += 1
+            while mt > mh and high[maxq[(mt - 1) % w]] <= high[i]:
+                mt -= 1
+            maxq[mt % w] = i
+            mt += 1
+            while nt > nh and low[minq[(nt - 1) % w]] >= low[i]:
+                nt -= 1
+            minq[nt % w] = i
+            nt += 1
+            if i >= w - 1:
+                hmax[k, i] = high[maxq[mh % w]]
+                lmin[k, i] = low[minq[nh % w]]
+
+    return hmax, lmin
+
+
+# Shared RSI intermediates, keyed by a digest of the close data and the
+# period so the delta/gain/loss pass runs once when several RSI variants
+# are requested. Content keying (rather than id(df)) stays correct when
+# frames are garbage collected and their ids reused.
+_RSI_CACHE = {}
+_RSI_CACHE_MAX = 64
+
+
+def _rsi_components_np(close: np.ndarray, length: int):
+    """Returns (avg_gain, avg_loss) arrays for a plain close array.
+
+    Rolling means are computed with cumulative sums in O(n).
+    """
+    n = close.size
+    delta = np.diff(close)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+
+    avg_gain = np.full(n, np.nan)
+    avg_loss = np.full(n, np.nan)
+    if delta.size >= length:
+        cg = np.concatenate(([0.0], np.cumsum(gain)))
+        cl = np.concatenate(([0.0], np.cumsum(loss)))
+        avg_gain[length:] = (cg[length:] - cg[:-length]) / length
+        avg_loss[length:] = (cl[length:] - cl[:-length]) / length
+
+    return avg_gain, avg_loss
+
+
+def _rsi_components(df: pd.DataFrame, length: int):
+    """DataFrame wrapper around _rsi_components_np, cached by
+    (close-data digest, period)."""
+    close = df['close'].to_numpy(dtype=np.float64)
+    key = (hashlib.md5(close.tobytes()).hexdigest(), length)
+    cached = _RSI_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    components = _rsi_components_np(close, length)
+    if len(_RSI_CACHE) >= _RSI_CACHE_MAX:
+        _RSI_CACHE.clear()
+    _RSI_CACHE[key] = components
+    return components
+
+
+
+# NumPy-native indicator cores. Backtester inner loops can call these
+# directly with a plain array and skip Series/index construction entirely;
+# the public calculate_* wrappers below just re-wrap with the frame index.
+
+def _calc_sma_np(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """SMA over a plain array via cumulative sums (NaN head pad)."""
+    out = np.full(close.size, np.nan)
+    if close.size >= length:
+        c = np.concatenate(([0.0], np.cumsum(close, dtype=np.float64)))
+        out[length - 1:] = (c[length:] - c[:-length]) / length
+    return out
+
+
+def _calc_ema_np(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """EMA over a plain array (adjust=False recurrence)."""
+    return _ewm(close, 2.0 / (length + 1))
+
+
+def _calc_wma_np(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """WMA over a plain array via one convolution (NaN head pad)."""
+    weights = np.arange(1, length + 1, dtype=close.dtype)
+    weights /= weights.sum()
+    out = np.convolve(close, weights[::-1], mode='valid')
+    return np.concatenate([np.full(length - 1, np.nan, dtype=out.dtype), out])
+
+
+def _calc_rsi_np(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """RSI over a plain array; rolling gain/loss means via cumulative sums."""
+    avg_gain, avg_loss = _rsi_components_np(close, length)
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+
+def _calc_macd_np(close: np.ndarray, fast: int = 12, slow: int = 26,
+                  signal: int = 9):
+    """MACD over a plain array; returns (macd, signal, histogram)."""
+    macd_line = _ewm(close, 2.0 / (fast + 1)) - _ewm(close, 2.0 / (slow + 1))
+    signal_line = _ewm(macd_line, 2.0 / (signal + 1))
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def _calc_atr_np(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                 length: int = 14) -> np.ndarray:
+    """ATR over plain arrays; true range in one vector pass, then EWM."""
+    tr = np.empty(high.size, dtype=high.dtype)
+    tr[0] = high[0] - low[0]
+    tr[1:] = np.maximum(high[1:] - low[1:],
+                        np.maximum(np.abs(high[1:] - close[:-1]),
+                                   np.abs(low[1:] - close[:-1])))
+    return _ewm(tr, 1.0 / length)
+
+
+def _calc_obv_np(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """OBV over plain arrays (branchless sign pass, float64 cumsum)."""
+    sign = np.sign(np.diff(close, prepend=close[0]))
+    return np.cumsum(sign * volume)
+
+
+def compute_indicators(df: pd.DataFrame,
+                       fast: int = 12, slow: int = 26, signal: int = 9,
+                       bb_length: int = 20, bb_std: float = 2.0,
+                       rsi_length: int = 14,
+                       stoch_period: int = 14,
+                       k_smooth: int = 3, d_smooth: int = 3) -> pd.DataFrame:
+    """
+    Computes MACD, Bollinger Bands, RSI and Stochastic RSI in one fused pass.
+    Args:
+        df: DataFrame with a 'close' column.
+        fast/slow/signal: MACD periods.
+        bb_length/bb_std: Bollinger Band period and width.
+        rsi_length: RSI period.
+        stoch_period/k_smooth/d_smooth: Stochastic RSI parameters.
+    Returns:
+        A DataFrame with all indicator columns, aligned to df.index.
+    """
+    close = np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64))
+    (_, _, macd, macd_signal, sma, std, rsi) = _fused_close_kernel(
+        close, fast, slow, signal, bb_length, rsi_length)
+
+    # Stochastic RSI from the fused RSI output (tiny compared to close).
+    # The RSI warm-up rows leave all-NaN windows and zero-width min/max
+    # ranges; those NaNs are the intended output, so silence the
+    # RuntimeWarnings they would otherwise raise on every call.
+    n = len(close)
+    stoch_k = np.full(n, np.nan)
+    stoch_d = np.full(n, np.nan)
+    if n >= stoch_period:
+        with np.errstate(invalid='ignore', divide='ignore'), \
+                warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            win = np.lib.stride_tricks.sliding_window_view(rsi, stoch_period)
+            rsi_min = np.nanmin(win, axis=1)
+            rsi_max = np.nanmax(win, axis=1)
+            stoch = np.full(n, np.nan)
+            stoch[stoch_period - 1:] = ((rsi[stoch_period - 1:] - rsi_min)
+                                        / (rsi_max - rsi_min) * 100)
+        if n >= stoch_period - 1 + k_smooth:
+            kwin = np.lib.stride_tricks.sliding_window_view(stoch, k_smooth)
+            stoch_k[k_smooth - 1:] = kwin.mean(axis=1)
+        if n >= stoch_period - 1 + k_smooth - 1 + d_smooth:
+            dwin = np.lib.stride_tricks.sliding_window_view(stoch_k, d_smooth)
+            stoch_d[d_smooth - 1:] = dwin.mean(axis=1)
+
+    return pd.DataFrame({
+        'MACD': macd,
+        'Signal': macd_signal,
+        'Histogram': macd - macd_signal,
+        'BB_Upper': sma + bb_std * std,
+        'BB_Middle': sma,
+        'BB_Lower': sma - bb_std * std,
+        'RSI': rsi,
+        'StochRSI_K': stoch_k,
+        'StochRSI_D': stoch_d,
+    }, index=df.index)
 
 def calculate_sma(df: pd.DataFrame, length: int = 14) -> pd.Series:
     """
@@ -11,7 +389,8 @@ def calculate_sma(df: pd.DataFrame, length: int = 14) -> pd.Series:
     Returns:
         A pandas Series with the SMA values.
     """
-    return df['close'].rolling(window=length).mean()
+    close = df['close'].to_numpy(dtype=np.float64, copy=False)
+    return pd.Series(_calc_sma_np(close, length), index=df.index)
 
 def calculate_ema(df: pd.DataFrame, length: int = 14) -> pd.Series:
     """
@@ -22,7 +401,9 @@ def calculate_ema(df: pd.DataFrame, length: int = 14) -> pd.Series:
     Returns:
         A pandas Series with the EMA values.
     """
-    return df['close'].ewm(span=length, adjust=False).mean()
+    # float32 is plenty for signal precision and halves memory bandwidth.
+    close = df['close'].to_numpy(dtype=np.float32)
+    return pd.Series(_calc_ema_np(close, length), index=df.index)
 
 def calculate_wma(df: pd.DataFrame, length: int = 14) -> pd.Series:
     """
@@ -33,8 +414,10 @@ def calculate_wma(df: pd.DataFrame, length: int = 14) -> pd.Series:
     Returns:
         A pandas Series with the WMA values.
     """
-    weights = pd.Series(range(1, length + 1))
-    return df['close'].rolling(window=length).apply(lambda prices: (prices * weights).sum() / weights.sum(), raw=True)
+    # One convolution instead of a Python lambda per window (float32 for
+    # bandwidth; the weighted sum is short enough that drift is negligible).
+    close = df['close'].to_numpy(dtype=np.float32)
+    return pd.Series(_calc_wma_np(close, length), index=df.index)
 
 def calculate_rsi(df: pd.DataFrame, length: int = 14) -> pd.Series:
     """
@@ -45,16 +428,11 @@ def calculate_rsi(df: pd.DataFrame, length: int = 14) -> pd.Series:
     Returns:
         A pandas Series with the RSI values.
     """
-    delta = df['close'].diff(1)
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
-    
-    avg_gain = gain.rolling(window=length, min_periods=length).mean()
-    avg_loss = loss.rolling(window=length, min_periods=length).mean()
+    avg_gain, avg_loss = _rsi_components(df, length)
 
     rs = avg_gain / avg_loss
     rsi = 100 - (100 / (1 + rs))
-    return rsi
+    return pd.Series(rsi, index=df.index)
 
 def calculate_macd(df: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9) -> pd.DataFrame:
     """
@@ -67,14 +445,11 @@ def calculate_macd(df: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int
     Returns:
         A DataFrame with MACD, Signal, and Histogram values.
     """
-    ema_fast = df['close'].ewm(span=fast, adjust=False).mean()
-    ema_slow = df['close'].ewm(span=slow, adjust=False).mean()
-    
-    macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    histogram = macd_line - signal_line
-    
-    return pd.DataFrame({'MACD': macd_line, 'Signal': signal_line, 'Histogram': histogram})
+    close = df['close'].to_numpy(dtype=np.float32)
+    macd_line, signal_line, histogram = _calc_macd_np(close, fast, slow,
+                                                      signal)
+    return pd.DataFrame({'MACD': macd_line, 'Signal': signal_line,
+                         'Histogram': histogram}, index=df.index)
 
 def calculate_bollinger_bands(df: pd.DataFrame, length: int = 20, std_dev: int = 2) -> pd.DataFrame:
     """
@@ -103,13 +478,10 @@ def calculate_atr(df: pd.DataFrame, length: int = 14) -> pd.Series:
     Returns:
         A pandas Series with ATR values.
     """
-    high_low = df['high'] - df['low']
-    high_close = (df['high'] - df['close'].shift()).abs()
-    low_close = (df['low'] - df['close'].shift()).abs()
-    
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    atr = tr.ewm(alpha=1/length, adjust=False).mean()
-    return atr
+    high = df['high'].to_numpy(dtype=np.float32)
+    low = df['low'].to_numpy(dtype=np.float32)
+    close = df['close'].to_numpy(dtype=np.float32)
+    return pd.Series(_calc_atr_np(high, low, close, length), index=df.index)
 
 def calculate_stochastic(df: pd.DataFrame, k_period: int = 14, d_period: int = 3) -> pd.DataFrame:
     """
@@ -121,10 +493,14 @@ def calculate_stochastic(df: pd.DataFrame, k_period: int = 14, d_period: int = 3
     Returns:
         A DataFrame with %K and %D values.
     """
-    low_min = df['low'].rolling(window=k_period).min()
-    high_max = df['high'].rolling(window=k_period).max()
-    
-    percent_k = 100 * ((df['close'] - low_min) / (high_max - low_min))
+    high = df['high'].to_numpy(dtype=np.float32)
+    low = df['low'].to_numpy(dtype=np.float32)
+    close = df['close'].to_numpy(dtype=np.float32)
+
+    hmax, lmin = _rolling_high_low(high, low,
+                                   np.array([k_period], dtype=np.int64))
+    percent_k = pd.Series(100 * (close - lmin[0]) / (hmax[0] - lmin[0]),
+                          index=df.index)
     percent_d = percent_k.rolling(window=d_period).mean()
     
     return pd.DataFrame({'%K': percent_k, '%D': percent_d})
@@ -137,8 +513,11 @@ def calculate_obv(df: pd.DataFrame) -> pd.Series:
     Returns:
         A pandas Series with OBV values.
     """
-    obv = (df['volume'] * (~df['close'].diff().le(0) * 2 - 1)).cumsum()
-    return obv
+    # Branchless: one sign pass and one multiply instead of mask algebra.
+    # Stays float64: the cumulative sum would drift in float32.
+    c = df['close'].to_numpy(dtype=np.float64)
+    v = df['volume'].to_numpy(dtype=np.float64)
+    return pd.Series(_calc_obv_np(c, v), index=df.index)
 
 def calculate_cci(df: pd.DataFrame, length: int = 20) -> pd.Series:
     """
@@ -149,11 +528,15 @@ def calculate_cci(df: pd.DataFrame, length: int = 20) -> pd.Series:
     Returns:
         A pandas Series with CCI values.
     """
-    typical_price = (df['high'] + df['low'] + df['close']) / 3
-    mean_deviation = typical_price.rolling(window=length).apply(lambda x: (x - x.mean()).abs().mean())
-    
-    cci = (typical_price - typical_price.rolling(window=length).mean()) / (0.015 * mean_deviation)
-    return cci
+    # Windowed mean/MAD on a 2D view instead of a Python lambda per window.
+    tp = ((df['high'] + df['low'] + df['close']) / 3).to_numpy(dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(tp, length)
+    mean = windows.mean(axis=1)
+    mad = np.abs(windows - mean[:, None]).mean(axis=1)
+
+    pad = np.full(length - 1, np.nan)
+    cci = (tp[length - 1:] - mean) / (0.015 * mad)
+    return pd.Series(np.concatenate([pad, cci]), index=df.index)
 
 
 
@@ -170,23 +553,21 @@ def calculate_fibonacci_retracement(df: pd.DataFrame, period: int = 100):
         DataFrame با سطوح فیبوناچی
     """
     # پیدا کردن بالاترین و پایین‌ترین قیمت در period اخیر
-    recent_high = df['high'].rolling(window=period).max()
-    recent_low = df['low'].rolling(window=period).min()
-    
-    diff = recent_high - recent_low
-    
-    # سطوح فیبوناچی کلاسیک
-    levels = {
-        'Fib_0': recent_high,
-        'Fib_236': recent_high - 0.236 * diff,
-        'Fib_382': recent_high - 0.382 * diff,
-        'Fib_500': recent_high - 0.500 * diff,
-        'Fib_618': recent_high - 0.618 * diff,
-        'Fib_786': recent_high - 0.786 * diff,
-        'Fib_100': recent_low
-    }
-    
-    return pd.DataFrame(levels)
+    hmax, lmin = _rolling_high_low(df['high'].to_numpy(dtype=np.float32),
+                                   df['low'].to_numpy(dtype=np.float32),
+                                   np.array([period], dtype=np.int64))
+    recent_high = hmax[0]
+    diff = recent_high - lmin[0]
+
+    # سطوح فیبوناچی کلاسیک — همه سطح‌ها با یک broadcast دوبعدی
+    ratios = np.array([0.0, 0.236, 0.382, 0.500, 0.618, 0.786, 1.0],
+                      dtype=np.float32)
+    out = recent_high[:, None] - ratios[None, :] * diff[:, None]
+
+    return pd.DataFrame(out,
+                        columns=['Fib_0', 'Fib_236', 'Fib_382', 'Fib_500',
+                                 'Fib_618', 'Fib_786', 'Fib_100'],
+                        index=df.index)
 
 
 def calculate_ichimoku(df: pd.DataFrame, 
@@ -200,20 +581,25 @@ def calculate_ichimoku(df: pd.DataFrame,
     Returns:
         DataFrame با خطوط Tenkan, Kijun, Senkou A, Senkou B, Chikou
     """
+    # هر سه پنجره (9/26/52) در یک فراخوانی کرنل deque یکنوا
+    hmax, lmin = _rolling_high_low(
+        df['high'].to_numpy(dtype=np.float32),
+        df['low'].to_numpy(dtype=np.float32),
+        np.array([tenkan_period, kijun_period, senkou_span_b_period],
+                 dtype=np.int64))
+
     # Tenkan-sen (خط تبدیل)
-    tenkan_sen = (df['high'].rolling(window=tenkan_period).max() + 
-                  df['low'].rolling(window=tenkan_period).min()) / 2
+    tenkan_sen = pd.Series((hmax[0] + lmin[0]) / 2, index=df.index)
     
     # Kijun-sen (خط پایه)
-    kijun_sen = (df['high'].rolling(window=kijun_period).max() + 
-                 df['low'].rolling(window=kijun_period).min()) / 2
+    kijun_sen = pd.Series((hmax[1] + lmin[1]) / 2, index=df.index)
     
     # Senkou Span A (خط پیشرو A)
     senkou_span_a = ((tenkan_sen + kijun_sen) / 2).shift(displacement)
     
     # Senkou Span B (خط پیشرو B)
-    senkou_span_b = ((df['high'].rolling(window=senkou_span_b_period).max() + 
-                      df['low'].rolling(window=senkou_span_b_period).min()) / 2).shift(displacement)
+    senkou_span_b = pd.Series((hmax[2] + lmin[2]) / 2,
+                              index=df.index).shift(displacement)
     
     # Chikou Span (خط تاخیری)
     chikou_span = df['close'].shift(-displacement)
@@ -238,16 +624,11 @@ def calculate_stochastic_rsi(df: pd.DataFrame,
     Returns:
         DataFrame با StochRSI_K و StochRSI_D
     """
-    # محاسبه RSI
-    delta = df['close'].diff()
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
-    
-    avg_gain = gain.rolling(window=rsi_period).mean()
-    avg_loss = loss.rolling(window=rsi_period).mean()
-    
+    # محاسبه RSI — از اجزای مشترک کش‌شده با calculate_rsi
+    avg_gain, avg_loss = _rsi_components(df, rsi_period)
+
     rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
+    rsi = pd.Series(100 - (100 / (1 + rs)), index=df.index)
     
     # محاسبه Stochastic RSI
     rsi_min = rsi.rolling(window=stoch_period).min()
@@ -274,8 +655,6 @@ def calculate_volatility_bands(df: pd.DataFrame,
     Returns:
         DataFrame با Upper, Middle, Lower bands
     """
-    from indicators import calculate_atr, calculate_sma
-    
     middle = calculate_sma(df, length)
     atr = calculate_atr(df, length)
     
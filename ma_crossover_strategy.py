@@ -1,6 +1,11 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 import yfinance as yf  # برای داده‌های نمونه (BTC-USD)
+from indicators import rolling_mean
 
 class MACrossoverStrategy:
     """
@@ -15,42 +20,86 @@ class MACrossoverStrategy:
             slow_period: دوره MA کند (مثلاً 50)
         """
         if df is None:
-            # داده نمونه: دانلود BTC از yfinance
-            self.df = yf.download('BTC-USD', start='2024-01-01', end='2025-11-15')['Close'].to_frame()
-            print("✅ داده‌های نمونه BTC دانلود شد")
+            # داده نمونه: دانلود BTC از yfinance با کش parquet یک‌ساعته،
+            # تا هر اجرای تیونینگ دوباره شبکه نرود
+            cache_path = 'btc_usd_yf.parquet'
+            if (os.path.exists(cache_path)
+                    and time.time() - os.path.getmtime(cache_path) < 3600):
+                self.df = pd.read_parquet(cache_path)
+                print("✅ داده‌های نمونه BTC از کش خوانده شد")
+            else:
+                self.df = yf.download('BTC-USD', start='2024-01-01', end='2025-11-15')['Close'].to_frame()
+                self.df.to_parquet(cache_path)
+                print("✅ داده‌های نمونه BTC دانلود شد")
         else:
-            self.df = df.copy()
+            # بدون copy — ستون‌های اندیکاتور بعداً با assign روی فریم جدید
+            # اضافه می‌شوند و فریم ورودی دست نمی‌خورد
+            self.df = df
             
         self.fast_period = fast_period
         self.slow_period = slow_period
         
+    @classmethod
+    def sweep(cls, close, periods):
+        """محاسبه MA همه دوره‌ها از یک prefix-sum مشترک (برای بهینه‌سازی پارامتر)
+
+        به جای rolling جداگانه برای هر دوره (O(P·N·W))، یک cumsum روی
+        close کافی است و MA هر دوره با یک تفاضل برداری O(N) از همان
+        آرایه درمی‌آید.
+
+        Args:
+            close: آرایه قیمت بسته شدن
+            periods: دوره‌های مورد آزمایش (مثلاً [10, 20, 50, 100, 200])
+
+        Returns:
+            dict از دوره → آرایه MA هم‌طول close (با NaN در warm-up)
+        """
+        close = np.asarray(close, dtype=np.float64)
+        s = np.concatenate(([0.0], np.cumsum(close)))
+        n = close.size
+
+        mas = {}
+        for k in periods:
+            ma = np.full(n, np.nan)
+            if n >= k:
+                ma[k - 1:] = (s[k:] - s[:-k]) / k
+            mas[k] = ma
+        return mas
+
     def calculate_indicators(self):
         """محاسبه Moving Average ها"""
-        # MA سریع
-        self.df['MA_Fast'] = self.df['Close'].rolling(window=self.fast_period).mean()
-        
-        # MA کند
-        self.df['MA_Slow'] = self.df['Close'].rolling(window=self.slow_period).mean()
-        
+        # کرنل running-sum به جای pandas rolling — یک جمع و یک تفریق به
+        # ازای هر گام، بدون materialize کردن پنجره‌ها
+        close = self.df['Close'].to_numpy(dtype=np.float64)
+
+        # assign فریم جدید می‌سازد و ورودی کاربر دست‌نخورده می‌ماند؛
         # حذف ردیف‌های NaN (اولین slow_period ردیف)
-        self.df = self.df.dropna()
+        self.df = self.df.assign(
+            MA_Fast=rolling_mean(close, self.fast_period),
+            MA_Slow=rolling_mean(close, self.slow_period)).dropna()
         
         print(f"✅ MA_Fast({self.fast_period}) و MA_Slow({self.slow_period}) محاسبه شد")
         print(f"📊 تعداد کندل‌های معتبر: {len(self.df)}")
         
     def generate_signals(self):
         """تولید سیگنال‌ها"""
-        # Signal: 1=صعودی, -1=نزولی, 0=خنثی
-        self.df['Signal'] = 0
-        self.df.loc[self.df['MA_Fast'] > self.df['MA_Slow'], 'Signal'] = 1
-        self.df.loc[self.df['MA_Fast'] < self.df['MA_Slow'], 'Signal'] = -1
-        
-        # Position: تشخیص تقاطع (diff Signal)
-        self.df['Position'] = self.df['Signal'].diff()
+        # Signal: 1=صعودی, -1=نزولی, 0=خنثی — یک np.sign به جای دو
+        # انتساب ماسکی روی کل ستون
+        fast = self.df['MA_Fast'].to_numpy()
+        slow = self.df['MA_Slow'].to_numpy()
+        sig = np.sign(fast - slow).astype(np.int8)
+
+        # Position: تشخیص تقاطع (تفاضل سیگنال با یک subtract برداری)
+        pos = np.empty_like(sig)
+        pos[0] = 0
+        np.subtract(sig[1:], sig[:-1], out=pos[1:])
+
+        self.df = self.df.assign(Signal=sig, Position=pos)
         
-        # شمارش تقاطع‌ها
-        golden_crosses = len(self.df[self.df['Position'] == 2.0])  # از -1 به 1
-        death_crosses = len(self.df[self.df['Position'] == -2.0])  # از 1 به -1
+        # شمارش تقاطع‌ها — count_nonzero روی آرایه به جای ساخت دو
+        # DataFrame فیلترشده فقط برای len گرفتن
+        golden_crosses = int(np.count_nonzero(pos == 2))   # از -1 به 1
+        death_crosses = int(np.count_nonzero(pos == -2))   # از 1 به -1
         
         print(f"✅ تعداد Golden Cross (خرید): {golden_crosses}")
         print(f"✅ تعداد Death Cross (فروش): {death_crosses}")
@@ -85,11 +134,13 @@ class MACrossoverStrategy:
             
         return last['Signal']  # 1=خرید, -1=فروش, 0=خنثی
         
-    def backtest(self, initial_capital: float = 10000):
+    def backtest(self, initial_capital: float = 10000, verbose: bool = True):
         """
         بک‌تست استراتژی
         Args:
             initial_capital: سرمایه اولیه (دلار)
+            verbose: گزارش تک‌تک معاملات (برای sweep خاموش شود — ساخت
+                     f-string و flush به stdout در اجرای دسته‌ای غالب می‌شود)
         Returns:
             trades_df: DataFrame معاملات
         """
@@ -97,88 +148,75 @@ class MACrossoverStrategy:
         print("📈 شروع بک‌تست MA Crossover")
         print("="*60)
         
-        capital = initial_capital
-        position = 0  # تعداد واحد (0=خارج از بازار)
-        entry_price = 0
-        entry_date = None
-        trades = []
-        
-        for i in range(len(self.df)):
-            current_price = self.df['Close'].iloc[i]
-            current_date = self.df.index[i]
-            current_position = self.df['Position'].iloc[i]
-            
-            if pd.isna(current_position):
-                continue
-                
-            # سیگنال خرید (Golden Cross)
-            if current_position == 2.0 and position == 0:
-                position = capital / current_price  # تمام سرمایه رو بخر
-                entry_price = current_price
-                entry_date = current_date
-                print(f"🟢 {current_date.date()}: خرید در ${entry_price:,.2f} (تعداد: {position:.6f})")
-                
-            # سیگنال فروش (Death Cross)
-            elif current_position == -2.0 and position > 0:
-                exit_price = current_price
-                profit = (exit_price - entry_price) * position
-                capital += profit  # به‌روزرسانی سرمایه
-                profit_pct = (exit_price - entry_price) / entry_price * 100
-                
-                trades.append({
-                    'entry_date': entry_date,
-                    'exit_date': current_date,
-                    'entry_price': entry_price,
-                    'exit_price': exit_price,
-                    'position_size': position,
-                    'profit': profit,
-                    'return_pct': profit_pct,
-                    'capital_after': capital
-                })
-                
-                print(f"🔴 {current_date.date()}: فروش در ${exit_price:,.2f}")
-                print(f"   💰 سود: ${profit:,.2f} ({profit_pct:+.2f}%)")
-                print(f"   💼 سرمایه: ${capital:,.2f}")
-                
-                position = 0  # خارج از بازار
-        
-        # اگر هنوز در بازار هستیم، در قیمت آخر بفروش
-        if position > 0:
-            exit_price = self.df['Close'].iloc[-1]
-            profit = (exit_price - entry_price) * position
-            capital += profit
-            profit_pct = (exit_price - entry_price) / entry_price * 100
-            
-            trades.append({
-                'entry_date': entry_date,
-                'exit_date': self.df.index[-1],
+        # استخراج یک‌باره آرایه‌ها؛ دسترسی iloc در حلقه به ازای هر کندل
+        # سربار پایتونی O(N) داشت در حالی که معاملات فقط چند ده تا هستند
+        close = self.df['Close'].to_numpy(dtype=np.float64)
+        pos = self.df['Position'].to_numpy(dtype=np.float64)
+        idx = self.df.index
+        n = close.size
+
+        buy_idx = np.flatnonzero(pos == 2.0)
+        sell_idx = np.flatnonzero(pos == -2.0)
+
+        # جفت‌کردن خرید→فروش متوالی؛ حلقه فقط روی تعداد معاملات است
+        entry_list = []
+        exit_list = []
+        last_exit = -1
+        for b in buy_idx:
+            if b <= last_exit:
+                continue  # هنوز در بازار هستیم
+            k = np.searchsorted(sell_idx, b + 1)
+            # اگر فروشی نمانده، فروش نهایی در کندل آخر
+            e = int(sell_idx[k]) if k < sell_idx.size else n - 1
+            entry_list.append(int(b))
+            exit_list.append(e)
+            last_exit = e
+
+        if entry_list:
+            entry_idx = np.asarray(entry_list)
+            exit_idx = np.asarray(exit_list)
+            entry_price = close[entry_idx]
+            exit_price = close[exit_idx]
+            returns = exit_price / entry_price - 1.0
+
+            # سرمایه هر بار کامل وارد می‌شود: ضرب تجمعی بازده‌ها
+            capital_after = initial_capital * np.cumprod(1.0 + returns)
+            capital_before = np.concatenate(([initial_capital],
+                                             capital_after[:-1]))
+            position_size = capital_before / entry_price
+            profit = capital_after - capital_before
+            capital = float(capital_after[-1])
+
+            trades_df = pd.DataFrame({
+                'entry_date': idx[entry_idx],
+                'exit_date': idx[exit_idx],
                 'entry_price': entry_price,
                 'exit_price': exit_price,
-                'position_size': position,
+                'position_size': position_size,
                 'profit': profit,
-                'return_pct': profit_pct,
-                'capital_after': capital
+                'return_pct': returns * 100,
+                'capital_after': capital_after
             })
-            
-            print(f"🔴 {self.df.index[-1].date()}: فروش نهایی در ${exit_price:,.2f}")
-            print(f"   💰 سود نهایی: ${profit:,.2f} ({profit_pct:+.2f}%)")
-            print(f"   💼 سرمایه نهایی: ${capital:,.2f}")
-        
-        # آمار کلی
-        total_return = (capital - initial_capital) / initial_capital * 100
-        
-        if trades:
-            trades_df = pd.DataFrame(trades)
-            winning_trades = len(trades_df[trades_df['profit'] > 0])
-            losing_trades = len(trades_df[trades_df['profit'] < 0])
-            win_rate = (winning_trades / len(trades)) * 100 if trades else 0
-            
-            avg_win = trades_df[trades_df['profit'] > 0]['return_pct'].mean() if winning_trades > 0 else 0
-            avg_loss = trades_df[trades_df['profit'] < 0]['return_pct'].mean() if losing_trades > 0 else 0
+
+            # گزارش معاملات — حلقه کوتاه روی معاملات، نه روی کندل‌ها
+            for t in range(len(entry_idx)) if verbose else ():
+                print(f"🟢 {idx[entry_idx[t]].date()}: خرید در ${entry_price[t]:,.2f} (تعداد: {position_size[t]:.6f})")
+                print(f"🔴 {idx[exit_idx[t]].date()}: فروش در ${exit_price[t]:,.2f}")
+                print(f"   💰 سود: ${profit[t]:,.2f} ({returns[t] * 100:+.2f}%)")
+                print(f"   💼 سرمایه: ${capital_after[t]:,.2f}")
+
+            winning_trades = int(np.count_nonzero(profit > 0))
+            losing_trades = int(np.count_nonzero(profit < 0))
+            win_rate = winning_trades / len(trades_df) * 100
+            avg_win = returns[profit > 0].mean() * 100 if winning_trades > 0 else 0
+            avg_loss = returns[profit < 0].mean() * 100 if losing_trades > 0 else 0
         else:
+            capital = initial_capital
             trades_df = pd.DataFrame()
             winning_trades = losing_trades = win_rate = avg_win = avg_loss = 0
-        
+
+        total_return = (capital - initial_capital) / initial_capital * 100
+
         # نمایش نتایج
         print("\n" + "="*60)
         print("📊 نتایج بک‌تست")
@@ -187,7 +225,7 @@ class MACrossoverStrategy:
         print(f"سرمایه نهایی: ${capital:,.2f}")
         print(f"سود/زیان کل: ${capital - initial_capital:,.2f}")
         print(f"بازده کل: {total_return:+.2f}%")
-        print(f"\nتعداد معاملات: {len(trades)}")
+        print(f"\nتعداد معاملات: {len(trades_df)}")
         print(f"معاملات سودده: {winning_trades} ({win_rate:.1f}%)")
         print(f"معاملات ضررده: {losing_trades}")
         if avg_win > 0:
@@ -197,6 +235,98 @@ class MACrossoverStrategy:
         
         return trades_df  # برای تحلیل بیشتر
 
+# دیتای مشترک workerها — در initializer یک بار به ازای هر پروسس ست
+# می‌شود تا DataFrame برای هر (fast, slow) دوباره pickle نشود
+_GRID_DF = None
+
+
+def _grid_init(df):
+    global _GRID_DF
+    _GRID_DF = df
+
+
+def fast_backtest(close, pos, initial_capital=10000.0):
+    """بک‌تست فقط-متریک: بدون DataFrame معاملات و بدون گزارش چاپی
+
+    همان جفت‌سازی خرید→فروش بک‌تست کامل، اما فقط روی آرایه‌ها؛ برای
+    sweep که تنها بازده کل/نرخ برد می‌خواهد، ساخت DataFrame و f-string
+    ها حذف می‌شود.
+
+    Returns:
+        dict با final_capital / total_return_pct / trades / win_rate
+    """
+    n = close.size
+    buy_idx = np.flatnonzero(pos == 2)
+    sell_idx = np.flatnonzero(pos == -2)
+
+    entry_list = []
+    exit_list = []
+    last_exit = -1
+    for b in buy_idx:
+        if b <= last_exit:
+            continue
+        k = np.searchsorted(sell_idx, b + 1)
+        e = int(sell_idx[k]) if k < sell_idx.size else n - 1
+        entry_list.append(int(b))
+        exit_list.append(e)
+        last_exit = e
+
+    if not entry_list:
+        return {'final_capital': initial_capital, 'total_return_pct': 0.0,
+                'trades': 0, 'win_rate': 0.0}
+
+    returns = close[np.asarray(exit_list)] / close[np.asarray(entry_list)] - 1.0
+    final_capital = initial_capital * float(np.prod(1.0 + returns))
+    wins = int(np.count_nonzero(returns > 0))
+    return {'final_capital': final_capital,
+            'total_return_pct': (final_capital / initial_capital - 1.0) * 100,
+            'trades': len(returns),
+            'win_rate': wins / len(returns) * 100}
+
+
+def _grid_eval(params):
+    """ارزیابی یک جفت (fast, slow) روی دیتای مشترک worker
+
+    کل مسیر آرایه‌ای است: MA ها از prefix-sum مشترک sweep، سیگنال با
+    np.sign و متریک‌ها از fast_backtest — هیچ شیء pandas ای ساخته نمی‌شود
+    """
+    fast, slow = params
+    close = _GRID_DF['Close'].to_numpy(dtype=np.float64)
+    mas = MACrossoverStrategy.sweep(close, (fast, slow))
+
+    sig = np.sign(np.nan_to_num(mas[fast] - mas[slow]))
+    pos = np.empty_like(sig)
+    pos[0] = 0
+    np.subtract(sig[1:], sig[:-1], out=pos[1:])
+
+    stats = fast_backtest(close, pos)
+    return {'fast': fast, 'slow': slow, **stats}
+
+
+def run_grid(df, grid, max_workers=None):
+    """بک‌تست شبکه پارامترها روی همه هسته‌ها
+
+    جفت‌های (fast, slow) هیچ حالت مشترکی ندارند، پس هر کدام در یک
+    پروسس جدا ارزیابی می‌شود؛ DataFrame فقط یک بار به ازای هر worker
+    منتقل می‌شود نه به ازای هر جفت.
+
+    Args:
+        df: DataFrame با ستون Close
+        grid: لیست جفت‌های (fast_period, slow_period)
+
+    Returns:
+        DataFrame نتایج، مرتب بر اساس بازده کل
+    """
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                             initializer=_grid_init,
+                             initargs=(df,)) as executor:
+        results = list(executor.map(_grid_eval, grid))
+
+    return (pd.DataFrame(results)
+            .sort_values('total_return_pct', ascending=False)
+            .reset_index(drop=True))
+
+
 # مثال استفاده
 if __name__ == "__main__":
     # ایجاد استراتژی
@@ -2,7 +2,12 @@ import pandas as pd
 import numpy as np
 from indicators import *
 import requests
+import requests_cache
 from datetime import datetime, timedelta
+
+# کش پاسخ‌های HTTP روی دیسک — اجرای دوباره اسکریپت هنگام تیون کردن،
+# به جای رفت‌وبرگشت شبکه از کش می‌خواند (انقضا: یک ساعت)
+requests_cache.install_cache('ohlc_cache', expire_after=3600)
 def get_nobitex_ohlc(symbol='BTCIRT', resolution='60', days=7):
     to_time = int(datetime.now().timestamp())
     from_time = int((datetime.now() - timedelta(days=days)).timestamp())
@@ -31,6 +36,12 @@ def get_nobitex_ohlc(symbol='BTCIRT', resolution='60', days=7):
             })
             
             df.set_index('timestamp', inplace=True)
+
+            # float32 برای محاسبات اندیکاتور کافی است (~۷ رقم معنادار)
+            # و پهنای باند حافظه کرنل‌های rolling را نصف می‌کند
+            for c in ['open', 'high', 'low', 'close', 'volume']:
+                df[c] = pd.to_numeric(df[c], downcast='float')
+
             print(f"{len(df)} candle received...")
             return df
         else:
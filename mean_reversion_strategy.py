@@ -1,6 +1,44 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt  # برای visualization (اختیاری)
+from indicators import rolling_mean, rolling_mean_std, rolling_atr
+from numba import njit
+
+
+@njit(cache=True)
+def _gen_signals(close, lower_band, ma_short, atr, trend_ok, atr_multiplier):
+    """ماشین حالت سیگنال‌دهی — حلقه ذاتاً ترتیبی (position و stop_price
+    حالت حمل می‌کنند) پس به جای حذف حلقه، خودش کامپایل می‌شود."""
+    n = close.size
+    signals = np.zeros(n, np.int64)  # 1: Buy, -1: Sell/Exit
+    positions = np.zeros(n, np.int64)  # 1: در پوزیشن خرید
+    stop_loss = np.full(n, np.nan)
+
+    position = 0
+    stop_price = 0.0
+
+    for i in range(1, n):
+        if position == 0:  # بدون پوزیشن
+            if close[i] < lower_band[i] and trend_ok[i]:
+                # ورود خرید
+                position = 1
+                stop_price = close[i] - atr_multiplier * atr[i]
+                signals[i] = 1
+                stop_loss[i] = stop_price
+        else:  # در پوزیشن خرید
+            # خروج: بازگشت به میانگین یا Stop Loss
+            if close[i] >= ma_short[i] or close[i] <= stop_price:
+                position = 0
+                signals[i] = -1
+            else:
+                # به‌روزرسانی Stop Loss (Trailing optional)
+                new_stop = close[i] - atr_multiplier * atr[i]
+                if new_stop > stop_price:
+                    stop_price = new_stop
+                    stop_loss[i] = stop_price
+        positions[i] = position
+
+    return signals, positions, stop_loss
 
 class MeanReversionStrategy:
     def __init__(self, df, short_window=20, std_dev=2, long_window=200, 
@@ -16,7 +54,9 @@ class MeanReversionStrategy:
         - atr_multiplier: ضریب ATR برای Stop Loss
         - risk_per_trade: ریسک به ازای هر معامله (درصد از اکوییتی)
         """
-        self.df = df.copy()
+        # بدون copy — ستون‌های اندیکاتور با assign روی فریم جدید اضافه
+        # می‌شوند و فریم ورودی دست نمی‌خورد
+        self.df = df
         self.short_window = short_window
         self.std_dev = std_dev
         self.long_window = long_window
@@ -26,68 +66,58 @@ class MeanReversionStrategy:
         self.risk_per_trade = risk_per_trade
         self.signals = None
         self.performance = {}
+        self._backtest_done = False
     
     def calculate_indicators(self):
         """محاسبه اندیکاتورها: Bollinger Bands, MA Long, Slope, ATR"""
-        # Bollinger Bands
-        self.df['ma_short'] = self.df['Close'].rolling(window=self.short_window).mean()
-        self.df['std_short'] = self.df['Close'].rolling(window=self.short_window).std()
-        self.df['upper_band'] = self.df['ma_short'] + self.std_dev * self.df['std_short']
-        self.df['lower_band'] = self.df['ma_short'] - self.std_dev * self.df['std_short']
-        
+        # استخراج یک‌باره ستون‌ها؛ کرنل‌های running-sum به جای pandas rolling
+        close = self.df['Close'].to_numpy(dtype=np.float64)
+
+        # Bollinger Bands — میانگین و انحراف معیار در یک گذر مشترک
+        ma_short, std_short = rolling_mean_std(close, self.short_window)
+
         # میانگین بلندمدت و شیب
-        self.df['ma_long'] = self.df['Close'].rolling(window=self.long_window).mean()
-        self.df['ma_long_slope'] = self.df['ma_long'].diff()
-        
-        # ATR برای Stop Loss
-        high_low = self.df['High'] - self.df['Low']
-        high_close = np.abs(self.df['High'] - self.df['Close'].shift())
-        low_close = np.abs(self.df['Low'] - self.df['Close'].shift())
-        true_range = np.maximum(high_low, np.maximum(high_close, low_close))
-        self.df['atr'] = true_range.rolling(window=14).mean()
-        
+        ma_long = rolling_mean(close, self.long_window)
+        ma_long_slope = np.diff(ma_long, prepend=np.nan)
+
+        # ATR برای Stop Loss — true range و میانگین ۱۴تایی در یک کرنل
+        # fused؛ هیچ آرایه میانی high_low/high_close/low_close ساخته نمی‌شود
+        high = self.df['High'].to_numpy(dtype=np.float64)
+        low = self.df['Low'].to_numpy(dtype=np.float64)
+        atr = rolling_atr(high, low, close, 14)
+
         # فیلتر روند: شیب کم + قیمت نزدیک به MA Long
-        price_deviation = (self.df['Close'] / self.df['ma_long'] - 1).abs()
-        self.df['trend_ok'] = (
-            (self.df['ma_long_slope'].abs() < self.slope_threshold) &
-            (price_deviation < self.price_threshold)
-        )
+        price_deviation = np.abs(close / ma_long - 1)
+        trend_ok = ((np.abs(ma_long_slope) < self.slope_threshold) &
+                    (price_deviation < self.price_threshold))
+
+        # انتساب یک‌جا؛ assign فریم جدید می‌سازد و ورودی دست‌نخورده می‌ماند
+        self.df = self.df.assign(
+            ma_short=ma_short, std_short=std_short,
+            upper_band=ma_short + self.std_dev * std_short,
+            lower_band=ma_short - self.std_dev * std_short,
+            ma_long=ma_long, ma_long_slope=ma_long_slope,
+            atr=atr, trend_ok=trend_ok)
         
         return self.df  # [web:6][web:21]
     
     def generate_signals(self):
         """تولید سیگنال‌ها با مدیریت پوزیشن و Stop Loss"""
         self.calculate_indicators()
-        self.df['signal'] = 0  # 1: Buy, -1: Sell/Exit
-        self.df['stop_loss'] = np.nan
-        position = 0
-        entry_price = 0
-        stop_price = 0
-        
-        for i in range(1, len(self.df)):
-            row = self.df.iloc[i]
-            
-            if position == 0:  # بدون پوزیشن
-                if (row['Close'] < row['lower_band']) and row['trend_ok']:
-                    # ورود خرید
-                    position = 1
-                    entry_price = row['Close']
-                    stop_price = entry_price - (self.atr_multiplier * row['atr'])
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = 1
-                    self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-            
-            elif position == 1:  # در پوزیشن خرید
-                # خروج: بازگشت به میانگین یا Stop Loss
-                if (row['Close'] >= row['ma_short']) or (row['Close'] <= stop_price):
-                    position = 0
-                    self.df.iloc[i, self.df.columns.get_loc('signal')] = -1
-                else:
-                    # به‌روزرسانی Stop Loss (Trailing optional)
-                    new_stop = row['Close'] - (self.atr_multiplier * row['atr'])
-                    if new_stop > stop_price:
-                        stop_price = new_stop
-                        self.df.iloc[i, self.df.columns.get_loc('stop_loss')] = stop_price
-        
+
+        # استخراج یک‌باره ستون‌ها و اجرای ماشین حالت در کرنل numba
+        signals, positions, stop_loss = _gen_signals(
+            self.df['Close'].to_numpy(dtype=np.float64),
+            self.df['lower_band'].to_numpy(dtype=np.float64),
+            self.df['ma_short'].to_numpy(dtype=np.float64),
+            self.df['atr'].to_numpy(dtype=np.float64),
+            self.df['trend_ok'].to_numpy(dtype=np.bool_),
+            self.atr_multiplier)
+
+        self.df['signal'] = signals
+        self.df['position'] = positions
+        self.df['stop_loss'] = stop_loss
+
         self.signals = self.df['signal'].copy()
         return self.signals  # [web:21][web:47]
     
@@ -95,8 +125,9 @@ class MeanReversionStrategy:
         """بک‌تست با محاسبه بازده، اکوییتی و معیارها"""
         self.generate_signals()
         
-        # محاسبه پوزیشن (1 برای Long)
-        self.df['position'] = self.signals.cumsum().clip(0, 1)  # فقط Long، max 1 position
+        # پوزیشن (1 برای Long) مستقیماً از ماشین حالت می‌آید؛
+        # cumsum().clip(0, 1) هم یک گذر اضافه بود و هم حالت واقعی را
+        # فقط به شرط جفت‌بودن سیگنال‌ها درست بازسازی می‌کرد
         
         # بازده
         self.df['market_return'] = self.df['Close'].pct_change()
@@ -115,6 +146,7 @@ class MeanReversionStrategy:
         max_dd = ((self.df['equity'] / self.df['equity'].cummax()) - 1).min()
         win_rate = (self.df['strategy_return'] > 0).sum() / (self.df['strategy_return'] != 0).sum() if (self.df['strategy_return'] != 0).sum() > 0 else 0
         
+        self._backtest_done = True
         self.performance = {
             'Total Return': total_return,
             'Sharpe Ratio': sharpe,
@@ -127,7 +159,11 @@ class MeanReversionStrategy:
     
     def plot_results(self):
         """رسم equity curve و سیگنال‌ها (اختیاری)"""
-        df_backtest, _ = self.backtest()
+        # اگر بک‌تست قبلاً اجرا شده، از همان نتایج استفاده می‌شود؛
+        # دوباره کل پایپ‌لاین اندیکاتور/سیگنال/بک‌تست اجرا نمی‌شود
+        if not self._backtest_done:
+            self.backtest()
+        df_backtest = self.df
         plt.figure(figsize=(12, 6))
         plt.plot(df_backtest.index, df_backtest['equity'], label='Strategy Equity')
         plt.plot(df_backtest.index, df_backtest['Close'] / df_backtest['Close'].iloc[0] * 100000, label='Buy & Hold')
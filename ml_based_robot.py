@@ -1,7 +1,20 @@
 import ccxt
+import joblib
+import os
+import time
 import pandas as pd
 
+MODEL_PATH = 'model.joblib'
+OHLC_CACHE_TTL = 3600  # ثانیه
+
 def fetch_data(symbol='BTC/USDT', timeframe='1h', limit=1000):
+    # کش parquet روی دیسک — اجرای دوباره حین توسعه به جای REST از دیسک
+    # می‌خواند (snappy حجم OHLCV را هم چند برابر کم می‌کند)
+    cache_path = f"{symbol.replace('/', '_')}_{timeframe}.parquet"
+    if (os.path.exists(cache_path)
+            and time.time() - os.path.getmtime(cache_path) < OHLC_CACHE_TTL):
+        return pd.read_parquet(cache_path)
+
     exchange = ccxt.binance()
     # دریافت 1000 کندل آخر
     ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
@@ -10,37 +23,137 @@ def fetch_data(symbol='BTC/USDT', timeframe='1h', limit=1000):
     df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     df.set_index('timestamp', inplace=True)
+
+    # float32 کافی است و نصف پهنای باند/حجم کش parquet
+    for c in ['open', 'high', 'low', 'close', 'volume']:
+        df[c] = pd.to_numeric(df[c], downcast='float')
+
+    df.to_parquet(cache_path)
     return df
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import ccxt.async_support as ccxt_async
+
+async def fetch_data_async(symbols, timeframe='1h', limit=1000):
+    """دریافت همزمان کندل چند نماد — زمان کل ~ یک RTT نه جمع RTTها"""
+    exchange = ccxt_async.binance()
+    try:
+        results = await asyncio.gather(
+            *[exchange.fetch_ohlcv(s, timeframe, limit=limit)
+              for s in symbols])
+    finally:
+        await exchange.close()
+
+    data = {}
+    for symbol, ohlcv in zip(symbols, results):
+        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.set_index('timestamp', inplace=True)
+        for c in ['open', 'high', 'low', 'close', 'volume']:
+            df[c] = pd.to_numeric(df[c], downcast='float')
+        data[symbol] = df
+    return data
+
+def scan_symbols(symbols, timeframe='1h', limit=1000):
+    """پایپ‌لاین چند‌نمادی: دریافت async + ساخت ویژگی‌ها موازی
+
+    کرنل numba داخل add_features حین اجرا GIL را آزاد می‌کند، پس ترد
+    پول کافی است و هزینه pickle/fork پروسس جدا را نمی‌پردازیم
+    """
+    data = asyncio.run(fetch_data_async(symbols, timeframe, limit))
+    with ThreadPoolExecutor() as pool:
+        featured = list(pool.map(add_features, data.values()))
+    return dict(zip(data.keys(), featured))
+
 # مثال استفاده
 df = fetch_data()
 print(f"داده دریافت شد: {len(df)} کندل")
 
 
-import pandas_ta as ta
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _build_features(close, rsi_len, ema_len):
+    """RSI (هموارسازی وایلدر)، EMA، بازده و ویژگی‌های تاخیری در یک گذر
+
+    RSI وایلدر یک میانگین نمایی جاری روی gain/loss است و EMA هم یک
+    بازگشت اسکالر؛ پس همه ویژگی‌ها بدون Series میانی از یک حلقه درمی‌آیند
+    """
+    n = close.size
+    rsi = np.full(n, np.nan)
+    ema = np.full(n, np.nan)
+    ret = np.full(n, np.nan)
+    rsi_lag1 = np.full(n, np.nan)
+    close_lag1 = np.full(n, np.nan)
+
+    avg_gain = 0.0
+    avg_loss = 0.0
+    ema_sum = 0.0
+    e = 0.0
+    alpha = 2.0 / (ema_len + 1)
+
+    for i in range(n):
+        if i > 0:
+            close_lag1[i] = close[i - 1]
+            ret[i] = close[i] / close[i - 1] - 1.0
+
+            # gain/loss بدون شاخه: نیم‌جمع با قدرمطلق به جای if —
+            # زنجیره diff/abs/mul-add برای LLVM قابل SIMD شدن است
+            delta = close[i] - close[i - 1]
+            abs_delta = abs(delta)
+            g = 0.5 * (delta + abs_delta)
+            l = 0.5 * (abs_delta - delta)
+            if i <= rsi_len:
+                # seed وایلدر: میانگین ساده اولین rsi_len تغییر
+                avg_gain += g
+                avg_loss += l
+                if i == rsi_len:
+                    avg_gain /= rsi_len
+                    avg_loss /= rsi_len
+            else:
+                avg_gain = (avg_gain * (rsi_len - 1) + g) / rsi_len
+                avg_loss = (avg_loss * (rsi_len - 1) + l) / rsi_len
+            if i >= rsi_len:
+                if avg_loss > 0.0:
+                    rsi[i] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+                elif avg_gain > 0.0:
+                    rsi[i] = 100.0
+            rsi_lag1[i] = rsi[i - 1]
+
+        # EMA با seed میانگین ساده (مثل pandas_ta)
+        if i < ema_len:
+            ema_sum += close[i]
+            if i == ema_len - 1:
+                e = ema_sum / ema_len
+                ema[i] = e
+        else:
+            e = e + alpha * (close[i] - e)
+            ema[i] = e
+
+    return rsi, ema, ret, rsi_lag1, close_lag1
+
 
 def add_features(df):
-    # 1. اندیکاتورهای تکنیکال
-    df['RSI'] = df.ta.rsi(length=14)
-    df['EMA_50'] = df.ta.ema(length=50)
-    
-    # 2. تغییرات قیمت (Returns) - برای نرمال‌سازی
-    df['Returns'] = df['close'].pct_change()
-    
-    # 3. ویژگی‌های تاخیری (Lagged) - مدل باید بداند "دیروز" چه خبر بود
-    df['RSI_Lag1'] = df['RSI'].shift(1)
-    df['Close_Lag1'] = df['close'].shift(1)
-    
-    # 4. هدف (Target): آیا کندل "بعدی" مثبت است؟ (1 یا 0)
-    # نکته مهم: اینجا از shift(-1) استفاده می‌کنیم (آینده) فقط برای آموزش
-    df['Target'] = (df['close'].shift(-1) > df['close']).astype(int)
-    
+    # همه ویژگی‌ها در یک گذر روی آرایه close — بدون pandas_ta
+    close = df['close'].to_numpy(dtype=np.float64)
+    rsi, ema, ret, rsi_lag1, close_lag1 = _build_features(close, 14, 50)
+
+    # هدف (Target): آیا کندل "بعدی" مثبت است؟ (1 یا 0)
+    # نکته مهم: نگاه به آینده فقط برای آموزش
+    target = np.zeros(close.size, dtype=np.int64)
+    target[:-1] = close[1:] > close[:-1]
+
+    df = df.assign(RSI=rsi, EMA_50=ema, Returns=ret,
+                   RSI_Lag1=rsi_lag1, Close_Lag1=close_lag1, Target=target)
     df.dropna(inplace=True) # حذف مقادیر خالی
     return df
 
 df = add_features(df)
 
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier
 
 # جدا کردن ویژگی‌ها (X) از هدف (y)
 features = ['RSI', 'EMA_50', 'Returns', 'RSI_Lag1']
@@ -52,11 +165,18 @@ train_size = int(len(X) * 0.8)
 X_train, X_test = X.iloc[:train_size], X.iloc[train_size:]
 y_train, y_test = y.iloc[:train_size], y.iloc[train_size:]
 
-# ساخت و آموزش مدل
-model = RandomForestClassifier(n_estimators=100, min_samples_split=10, random_state=42)
+# ساخت و آموزش مدل — بوستینگ هیستوگرامی: ویژگی‌ها یک بار به ۲۵۵ سطل
+# باکت می‌شوند و هر split یک اسکن O(N) است، نه sort مثل جنگل تصادفی
+model = HistGradientBoostingClassifier(max_iter=200, learning_rate=0.05,
+                                       max_bins=255, early_stopping=True,
+                                       random_state=42)
 model.fit(X_train, y_train)
 print("مدل آموزش دید.")
 
+# ذخیره مدل آموزش‌دیده — در استقرار، fit فقط یک بار اجرا می‌شود و
+# live_trade مدل را از دیسک می‌خواند
+joblib.dump(model, MODEL_PATH, compress=3)
+
 from sklearn.metrics import precision_score
 
 # پیش‌بینی روی داده‌های تست
@@ -66,6 +186,19 @@ preds = model.predict(X_test)
 precision = precision_score(y_test, preds)
 print(f"Dext (Precision): {precision:.2f}") 
 # اگر عدد 0.55 باشد یعنی ۵۵٪ سیگنال‌های خرید درست بوده است.
+_live_model = None
+
+def _get_model():
+    """بارگذاری تنبل مدل از دیسک، یک بار به ازای هر فرایند
+
+    mmap_mode='r' آرایه‌های مدل را map می‌کند نه کپی؛ چند worker همان
+    صفحه‌های فقط-خواندنی را به اشتراک می‌گذارند
+    """
+    global _live_model
+    if _live_model is None:
+        _live_model = joblib.load(MODEL_PATH, mmap_mode='r')
+    return _live_model
+
 def live_trade():
     # 1. دریافت داده‌های زنده
     live_data = fetch_data(limit=100)
@@ -74,8 +207,8 @@ def live_trade():
     # 2. انتخاب آخرین کندل (که هنوز بسته نشده یا تازه بسته شده)
     last_row = live_data.iloc[[-1]][features]
     
-    # 3. پرسش از مدل
-    prediction = model.predict(last_row)[0]
+    # 3. پرسش از مدل ذخیره‌شده (بدون نیاز به fit دوباره در هر tick)
+    prediction = _get_model().predict(last_row)[0]
     
     if prediction == 1:
         print("سیگنال خرید صادر شد! 🚀")
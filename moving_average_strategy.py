@@ -18,7 +18,9 @@ class MACrossoverStrategy:
             slow_period: دوره میانگین کند (پیش‌فرض: 50)
             ma_type: نوع میانگین ('SMA' یا 'EMA')
         """
-        self.df = df.copy()
+        # بدون copy — ستون‌های اندیکاتور با assign روی فریم جدید اضافه
+        # می‌شوند و فریم ورودی دست نمی‌خورد
+        self.df = df
         self.fast_period = fast_period
         self.slow_period = slow_period
         self.ma_type = ma_type
@@ -26,33 +28,42 @@ class MACrossoverStrategy:
     def calculate_indicators(self):
         """محاسبه میانگین‌های متحرک"""
         if self.ma_type == 'SMA':
-            self.df['MA_Fast'] = calculate_sma(self.df, self.fast_period)
-            self.df['MA_Slow'] = calculate_sma(self.df, self.slow_period)
+            ma_fast = calculate_sma(self.df, self.fast_period)
+            ma_slow = calculate_sma(self.df, self.slow_period)
         elif self.ma_type == 'EMA':
-            self.df['MA_Fast'] = calculate_ema(self.df, self.fast_period)
-            self.df['MA_Slow'] = calculate_ema(self.df, self.slow_period)
+            ma_fast = calculate_ema(self.df, self.fast_period)
+            ma_slow = calculate_ema(self.df, self.slow_period)
         else:
             raise ValueError("ma_type باید 'SMA' یا 'EMA' باشد")
+
+        # assign فریم جدید می‌سازد و ورودی کاربر دست‌نخورده می‌ماند
+        self.df = self.df.assign(MA_Fast=ma_fast, MA_Slow=ma_slow)
         
         print(f"✅ {self.ma_type}({self.fast_period}) و {self.ma_type}({self.slow_period}) محاسبه شدند")
         
     def generate_signals(self):
         """تولید سیگنال‌های خرید و فروش"""
         # شرط خرید: MA سریع از پایین MA کند را قطع کند
-        self.df['Signal'] = 0
-        
-        # 1 = خرید، -1 = فروش
-        self.df.loc[self.df['MA_Fast'] > self.df['MA_Slow'], 'Signal'] = 1
-        self.df.loc[self.df['MA_Fast'] < self.df['MA_Slow'], 'Signal'] = -1
-        
-        # تشخیص نقاط تقاطع (جایی که سیگنال تغییر می‌کند)
-        self.df['Position'] = self.df['Signal'].diff()
+        # 1 = خرید، -1 = فروش — یک np.sign به جای دو انتساب ماسکی.
+        # NaN های warm-up ابتدای MA ها قبل از cast صفر می‌شوند تا مثل
+        # انتساب‌های ماسکی قبلی Signal=0 بمانند
+        fast = self.df['MA_Fast'].to_numpy()
+        slow = self.df['MA_Slow'].to_numpy()
+        sig = np.sign(np.nan_to_num(fast - slow, copy=False)).astype(np.int8)
+
+        # تشخیص نقاط تقاطع (تفاضل سیگنال با یک subtract برداری)
+        pos = np.empty_like(sig)
+        pos[0] = 0
+        np.subtract(sig[1:], sig[:-1], out=pos[1:])
+
+        self.df = self.df.assign(Signal=sig, Position=pos)
         
         # Position = 2: تقاطع صعودی (Golden Cross) → خرید
         # Position = -2: تقاطع نزولی (Death Cross) → فروش
         
-        buy_signals = len(self.df[self.df['Position'] == 2])
-        sell_signals = len(self.df[self.df['Position'] == -2])
+        # count_nonzero روی آرایه به جای ساخت DataFrame فیلترشده
+        buy_signals = int(np.count_nonzero(pos == 2))
+        sell_signals = int(np.count_nonzero(pos == -2))
         
         print(f"✅ تعداد سیگنال‌های خرید: {buy_signals}")
         print(f"✅ تعداد سیگنال‌های فروش: {sell_signals}")
@@ -84,12 +95,14 @@ class MACrossoverStrategy:
             
         return last['Signal']
     
-    def backtest(self, initial_capital: float = 10_000_000):
+    def backtest(self, initial_capital: float = 10_000_000,
+                 verbose: bool = True):
         """
         بک‌تست استراتژی
         
         Args:
             initial_capital: سرمایه اولیه (تومان)
+            verbose: گزارش تک‌تک معاملات (برای اجرای دسته‌ای خاموش شود)
             
         Returns:
             DataFrame با نتایج معاملات
@@ -98,67 +111,75 @@ class MACrossoverStrategy:
         print("📈 شروع بک‌تست")
         print("="*60)
         
-        capital = initial_capital
-        position = 0  # 0 = خارج از بازار، تعداد واحد = در بازار
-        entry_price = 0
-        trades = []
-        
-        for i in range(len(self.df)):
-            if pd.isna(self.df['Position'].iloc[i]):
-                continue
-            
-            current_price = self.df['close'].iloc[i]
-            current_date = self.df.index[i]
-            
-            # سیگنال خرید (Golden Cross)
-            if self.df['Position'].iloc[i] == 2 and position == 0:
-                position = capital / current_price
-                entry_price = current_price
-                print(f"🟢 {current_date}: خرید در {entry_price:,.0f}")
-                
-            # سیگنال فروش (Death Cross)
-            elif self.df['Position'].iloc[i] == -2 and position > 0:
-                exit_price = current_price
-                profit = (exit_price - entry_price) * position
-                capital += profit
-                profit_pct = (exit_price - entry_price) / entry_price * 100
-                
-                trades.append({
-                    'entry_date': entry_date,
-                    'exit_date': current_date,
-                    'entry_price': entry_price,
-                    'exit_price': exit_price,
-                    'profit': profit,
-                    'return_pct': profit_pct,
-                    'capital': capital
-                })
-                
-                print(f"🔴 {current_date}: فروش در {exit_price:,.0f}")
-                print(f"   💰 سود: {profit:,.0f} ({profit_pct:+.2f}%)")
-                print(f"   💼 سرمایه: {capital:,.0f}")
-                
-                position = 0
-            
-            # ذخیره تاریخ ورود
-            if position > 0 and 'entry_date' not in locals():
-                entry_date = current_date
-        
-        # محاسبه آمار کلی
-        total_return = (capital - initial_capital) / initial_capital * 100
-        
-        if trades:
-            trades_df = pd.DataFrame(trades)
-            winning_trades = len(trades_df[trades_df['profit'] > 0])
-            losing_trades = len(trades_df[trades_df['profit'] < 0])
-            win_rate = winning_trades / len(trades) * 100
-            
-            avg_profit = trades_df[trades_df['profit'] > 0]['return_pct'].mean()
-            avg_loss = trades_df[trades_df['profit'] < 0]['return_pct'].mean()
+        # استخراج یک‌باره آرایه‌ها؛ iloc به ازای هر کندل سربار پایتونی
+        # O(N) داشت در حالی که معاملات فقط چند ده تا هستند
+        close = self.df['close'].to_numpy(dtype=np.float64)
+        pos = self.df['Position'].to_numpy(dtype=np.float64)
+        idx = self.df.index
+
+        buy_idx = np.flatnonzero(pos == 2)
+        sell_idx = np.flatnonzero(pos == -2)
+
+        # جفت‌کردن خرید→فروش متوالی؛ حلقه فقط روی تعداد معاملات است
+        # (خریدِ بدون فروش بعدی مثل قبل باز می‌ماند و ثبت نمی‌شود)
+        entry_list = []
+        exit_list = []
+        last_exit = -1
+        for b in buy_idx:
+            if b <= last_exit:
+                continue  # هنوز در بازار هستیم
+            k = np.searchsorted(sell_idx, b + 1)
+            if k >= sell_idx.size:
+                break
+            e = int(sell_idx[k])
+            entry_list.append(int(b))
+            exit_list.append(e)
+            last_exit = e
+
+        if entry_list:
+            entry_idx = np.asarray(entry_list)
+            exit_idx = np.asarray(exit_list)
+            entry_price = close[entry_idx]
+            exit_price = close[exit_idx]
+            returns = exit_price / entry_price - 1.0
+
+            # سرمایه هر بار کامل وارد می‌شود: ضرب تجمعی بازده‌ها
+            capital_arr = initial_capital * np.cumprod(1.0 + returns)
+            capital_before = np.concatenate(([initial_capital],
+                                             capital_arr[:-1]))
+            profit = capital_arr - capital_before
+            capital = float(capital_arr[-1])
+
+            trades_df = pd.DataFrame({
+                'entry_date': idx[entry_idx],
+                'exit_date': idx[exit_idx],
+                'entry_price': entry_price,
+                'exit_price': exit_price,
+                'profit': profit,
+                'return_pct': returns * 100,
+                'capital': capital_arr
+            })
+
+            # گزارش معاملات — حلقه کوتاه روی معاملات، نه روی کندل‌ها
+            for t in range(len(entry_idx)) if verbose else ():
+                print(f"🟢 {idx[entry_idx[t]]}: خرید در {entry_price[t]:,.0f}")
+                print(f"🔴 {idx[exit_idx[t]]}: فروش در {exit_price[t]:,.0f}")
+                print(f"   💰 سود: {profit[t]:,.0f} ({returns[t] * 100:+.2f}%)")
+                print(f"   💼 سرمایه: {capital_arr[t]:,.0f}")
+
+            winning_trades = int(np.count_nonzero(profit > 0))
+            losing_trades = int(np.count_nonzero(profit < 0))
+            win_rate = winning_trades / len(trades_df) * 100
+            avg_profit = returns[profit > 0].mean() * 100 if winning_trades else 0
+            avg_loss = returns[profit < 0].mean() * 100 if losing_trades else 0
         else:
+            capital = initial_capital
             trades_df = pd.DataFrame()
             winning_trades = losing_trades = 0
             win_rate = avg_profit = avg_loss = 0
-        
+
+        total_return = (capital - initial_capital) / initial_capital * 100
+
         # نمایش نتایج
         print("\n" + "="*60)
         print("📊 نتایج بک‌تست")
@@ -167,7 +188,7 @@ class MACrossoverStrategy:
         print(f"سرمایه نهایی: {capital:,.0f}")
         print(f"سود/زیان کل: {capital - initial_capital:,.0f}")
         print(f"بازده کل: {total_return:+.2f}%")
-        print(f"\nتعداد کل معاملات: {len(trades)}")
+        print(f"\nتعداد کل معاملات: {len(trades_df)}")
         print(f"معاملات سودده: {winning_trades} ({win_rate:.1f}%)")
         print(f"معاملات ضررده: {losing_trades} ({100-win_rate:.1f}%)")
         
@@ -1,8 +1,34 @@
+import numpy as np
 import pandas as pd
+from numba import njit
+
+
+@njit(cache=True)
+def _count_transitions(sig):
+    """شمارش گذرهای سیگنال در یک گذر streaming
+
+    به جای ساختن ستون Position فقط برای شمردن ==2 و ==-2، تفاضل
+    متوالی همان‌جا حساب و شمرده می‌شود — بدون آرایه میانی به طول N.
+    """
+    buys = 0
+    sells = 0
+    prev = np.int8(0)
+    for v in sig:
+        d = v - prev
+        if d == 2:
+            buys += 1
+        elif d == -2:
+            sells += 1
+        prev = v
+    return buys, sells
+
+
 class RSIReversalStrategy:
     def __init__(self, df: pd.DataFrame, rsi_period: int = 14,
                  oversold_threshold: int = 30, overbought_threshold: int = 70):
-        self.df = df.copy()
+        # بدون copy — ستون‌های RSI/Signal/Position با assign روی فریم
+        # جدید اضافه می‌شوند و فریم ورودی دست نمی‌خورد
+        self.df = df
         self.rsi_period = rsi_period
         self.oversold = oversold_threshold
         self.overbought = overbought_threshold
@@ -10,41 +36,50 @@ class RSIReversalStrategy:
     def calculate_indicators(self):
         """محاسبه RSI"""
         from indicators import calculate_rsi
-        self.df['RSI'] = calculate_rsi(self.df, self.rsi_period)
+        # float32 برای مقایسه با آستانه‌های 30/70 کاملاً کافی است و حجم
+        # ستون و پهنای باند مقایسه‌های بعدی را نصف می‌کند
+        rsi = calculate_rsi(self.df, self.rsi_period).astype(np.float32)
+        self.df = self.df.assign(RSI=rsi)
         print(f"✅ RSI({self.rsi_period}) محاسبه شد")
         
     def generate_signals(self):
         """تولید سیگنال‌ها"""
-        self.df['Signal'] = 0
-        
-        # سیگنال خرید: RSI زیر سطح اشباع فروش
-        self.df.loc[self.df['RSI'] < self.oversold, 'Signal'] = 1
-        
-        # سیگنال فروش: RSI بالای سطح اشباع خرید
-        self.df.loc[self.df['RSI'] > self.overbought, 'Signal'] = -1
-        
-        # تشخیص تغییر (فقط برای نمایش)
-        self.df['Position'] = self.df['Signal'].diff()
-        
-        buy_signals = len(self.df[self.df['Position'] == 2])
-        sell_signals = len(self.df[self.df['Position'] == -2])
+        # زنجیره branchless به جای np.where تو در تو: clip/تفریق/sign همه
+        # SIMD ساده‌اند و شرط وابسته ندارند؛ int8 کافی است. NaN های
+        # warm-up ابتدای RSI قبل از cast باید صفر شوند (مثل where قبلی)
+        rsi = self.df['RSI'].to_numpy(copy=False)
+        raw = ((self.oversold - rsi).clip(min=0)
+               - (rsi - self.overbought).clip(min=0))
+        signal = np.sign(np.nan_to_num(raw, copy=False)).astype(np.int8)
+
+        # شمارش گذرها streaming در کرنل — ستون Position دیگر ساخته
+        # نمی‌شود (آخرین گذر در get_latest_signal از Signal درمی‌آید)
+        self.df = self.df.assign(Signal=signal)
+
+        buy_signals, sell_signals = _count_transitions(signal)
         
         print(f"✅ تعداد سیگنال‌های خرید: {buy_signals}")
         print(f"✅ تعداد سیگنال‌های فروش: {sell_signals}")
         
     def get_latest_signal(self):
         """دریافت آخرین سیگنال"""
-        last = self.df.iloc[-1]
+        # خواندن مستقیم از آرایه‌ها — iloc[-1] برای چهار فیلد یک Series
+        # کامل (کپی سطر + ایندکس) می‌سازد
+        close_last = self.df['close'].to_numpy(copy=False)[-1]
+        rsi_last = self.df['RSI'].to_numpy(copy=False)[-1]
+        # گذر آخر از دو مقدار انتهایی Signal — بدون ستون Position
+        sig = self.df['Signal'].to_numpy(copy=False)
+        position = int(sig[-1]) - int(sig[-2]) if sig.size > 1 else 0
         
         print("\n" + "="*60)
         print("📊 وضعیت فعلی RSI")
         print("="*60)
-        print(f"قیمت: {last['close']:,.0f}")
-        print(f"RSI({self.rsi_period}): {last['RSI']:.2f}")
+        print(f"قیمت: {close_last:,.0f}")
+        print(f"RSI({self.rsi_period}): {rsi_last:.2f}")
         
-        if last['Position'] == 2:
+        if position == 2:
             print("\n🟢 سیگنال خرید! (RSI اشباع فروش)")
-            print(f"RSI = {last['RSI']:.2f} < {self.oversold}")
-        elif last['Position'] == -2:
+            print(f"RSI = {rsi_last:.2f} < {self.oversold}")
+        elif position == -2:
             print("\n🔴 سیگنال فروش! (RSI اشباع خرید)")
-            print(f"RSI = {last['RSI']:.2f} > {self.overbought}")
+            print(f"RSI = {rsi_last:.2f} > {self.overbought}")
@@ -1,9 +1,26 @@
 import ccxt
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import queue
+import telegram
+import threading
+import numpy as np
 import time
 import logging
+from collections import defaultdict
+from arb_kernel import scan_triangles
 from datetime import datetime
 
 class TriangularArbitrageBot:
+    # کش class-level بازارها: متادیتای بازار در مقیاس ساعت عوض می‌شود،
+    # پس نیازی نیست هر instance جدا load_markets (HTTP + parse چند
+    # مگابایت JSON) بزند. کلید: (exchange_id, پنجره یک‌ساعته)
+    _markets_cache = {}
+    _MARKETS_TTL = 3600
+
     def __init__(self, exchange_id='binance', base_currency='USDT'):
         self.exchange = getattr(ccxt, exchange_id)({
             'apiKey': 'YOUR_API_KEY',
@@ -12,60 +29,195 @@ class TriangularArbitrageBot:
         })
         self.base_currency = base_currency
         self.min_profit_threshold = 0.5  # حداقل 0.5% سود
-        
-    def fetch_orderbook(self, symbol):
-        """دریافت order book برای محاسبه دقیق قیمت"""
-        orderbook = self.exchange.fetch_order_book(symbol)
-        bid = orderbook['bids'][0][0] if len(orderbook['bids']) > 0 else None
-        ask = orderbook['asks'][0][0] if len(orderbook['asks']) > 0 else None
-        return {'bid': bid, 'ask': ask}
+        self.fee_rate = 0.001  # کارمزد هر معامله (معمولاً 0.1% در binance)
+        # ضریب ثابت کارمزد سه معامله — یک بار محاسبه، نه در هر ارزیابی
+        self._fee_cube = (1 - self.fee_rate) ** 3
+        # نوتیفیکیشن تلگرام در ترد پس‌زمینه؛ یک رفت‌وبرگشت HTTP کند
+        # نباید حلقه اسکن را نگه دارد
+        self._tg_queue = queue.Queue()
+        self._tg_bot = telegram.Bot(token='YOUR_TELEGRAM_BOT_TOKEN')
+        self._tg_chat = 'YOUR_CHAT_ID'
+        threading.Thread(target=self._tg_worker, daemon=True).start()
+        # top-of-book محلی: نماد -> (bid, ask)؛ هر اسکن یک بار پر می‌شود
+        self.book = {}
+        self._bid = None
+        self._ask = None
+        self._affected = None  # مثلث‌های نیازمند ارزیابی دوباره
+
+    def refresh_book(self, symbols):
+        """به‌روزرسانی top-of-book همه نمادها با یک فراخوانی bulk
+
+        قبلاً هر مثلث سه fetch_order_book جدا می‌زد (۳N رفت‌وبرگشت REST
+        در هر اسکن)؛ حالا یک فراخوانی برای همه نمادها و ارزیابی مثلث‌ها
+        فقط lookup دیکشنری است
+        """
+        if self.exchange.has.get('fetchOrderBooks'):
+            books = self.exchange.fetch_order_books(symbols)
+            self.book = {
+                sym: (ob['bids'][0][0] if ob['bids'] else None,
+                      ob['asks'][0][0] if ob['asks'] else None)
+                for sym, ob in books.items()
+            }
+        else:
+            tickers = self.exchange.fetch_tickers(symbols)
+            self.book = {sym: (t.get('bid'), t.get('ask'))
+                         for sym, t in tickers.items()}
+
+        # آرایه‌های bid/ask هم‌ترتیب با self.symbols؛ نماد بدون قیمت NaN
+        # می‌شود و در کرنل خودبه‌خود رد می‌شود. float32 برای آستانه
+        # ۰.۵٪ کاملاً کافی است و پهنای باند را نصف می‌کند
+        new_bid = np.array([(self.book.get(sym) or (None, None))[0] or np.nan
+                            for sym in self.symbols], dtype=np.float32)
+        new_ask = np.array([(self.book.get(sym) or (None, None))[1] or np.nan
+                            for sym in self.symbols], dtype=np.float32)
+
+        # تشخیص نمادهای تغییرکرده و مثلث‌های وابسته به آن‌ها؛
+        # NaN پایدار (هر دو طرف NaN) «تغییر» حساب نمی‌شود
+        if self._bid is None or self._bid.shape != new_bid.shape:
+            self._affected = None  # اولین پر شدن: همه مثلث‌ها
+        else:
+            bid_changed = ((new_bid != self._bid)
+                           & ~(np.isnan(new_bid) & np.isnan(self._bid)))
+            ask_changed = ((new_ask != self._ask)
+                           & ~(np.isnan(new_ask) & np.isnan(self._ask)))
+            ids = [self._sym2tri[c]
+                   for c in np.flatnonzero(bid_changed | ask_changed)
+                   if c in self._sym2tri]
+            self._affected = (np.unique(np.concatenate(ids)) if ids
+                              else np.empty(0, dtype=np.int32))
+
+        self._bid = new_bid
+        self._ask = new_ask
+
+    def _build_index(self, triangular_pairs):
+        """چیدمان SoA برای ارزیابی برداری: آرایه نمادهای یکتا + ایندکس
+        صحیح هر پای مثلث در آن، تا هر اسکن یک عبارت NumPy شود"""
+        self.triangles = triangular_pairs
+        self.symbols = sorted({sym for t in triangular_pairs
+                               for sym in t['path']})
+        # نگاشت نماد -> شناسه صحیح؛ مسیر داغ فقط با این شناسه‌ها کار
+        # می‌کند و لیست دیکشنری‌ها صرفاً برای فرمت نوتیفیکیشن می‌ماند.
+        # int32 برای چند هزار نماد کافی است و ردپای کش را نصف می‌کند
+        self.sym_id = {sym: i for i, sym in enumerate(self.symbols)}
+        self._idx_a = np.array([self.sym_id[t['path'][0]]
+                                for t in triangular_pairs], dtype=np.int32)
+        self._idx_b = np.array([self.sym_id[t['path'][1]]
+                                for t in triangular_pairs], dtype=np.int32)
+        self._idx_c = np.array([self.sym_id[t['path'][2]]
+                                for t in triangular_pairs], dtype=np.int32)
+
+        # ایندکس معکوس «نماد -> مثلث‌های وابسته» برای ارزیابی تفاضلی:
+        # فقط مثلث‌هایی که قیمت یکی از پاهایشان عوض شده دوباره حساب می‌شوند
+        sym2tri = defaultdict(list)
+        for t_id, t in enumerate(triangular_pairs):
+            for sym in t['path']:
+                sym2tri[self.sym_id[sym]].append(t_id)
+        self._sym2tri = {k: np.array(v, dtype=np.int32)
+                         for k, v in sym2tri.items()}
+
+    def _load_markets(self):
+        """فهرست بازارها با کش class-level و کش دیسک gzip
+
+        اول کش حافظه (بین instance ها مشترک)، بعد کش دیسک در
+        ~/.cache تا ری‌استارت پروسه هم از HTTP معاف باشد، و فقط در
+        نبود هر دو load_markets واقعی.
+        """
+        key = (self.exchange.id, time.time() // self._MARKETS_TTL)
+        markets = self._markets_cache.get(key)
+        if markets is not None:
+            return markets
+
+        disk_path = os.path.expanduser(
+            f'~/.cache/ccxt-markets-{self.exchange.id}.json.gz')
+        if os.path.exists(disk_path):
+            try:
+                if time.time() - os.path.getmtime(disk_path) < self._MARKETS_TTL:
+                    with gzip.open(disk_path, 'rt') as f:
+                        markets = json.load(f)
+            except Exception:
+                markets = None
+        if markets is None:
+            markets = self.exchange.load_markets()
+            try:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                with gzip.open(disk_path, 'wt') as f:
+                    json.dump(markets, f)
+            except Exception as e:
+                logging.error(f"Error caching markets: {e}")
+
+        self._markets_cache.clear()  # فقط پنجره جاری را نگه دار
+        self._markets_cache[key] = markets
+        return markets
 
     def find_triangular_pairs(self):
         """پیدا کردن تمام مثلث‌های ممکن که با USDT شروع می‌شوند"""
-        markets = self.exchange.load_markets()
+        markets = self._load_markets()
+
+        # کش دیسک با کلید hash فهرست بازارها — ری‌استارت‌ها اسکن را
+        # رد می‌کنند مگر بازارهای صرافی عوض شده باشند
+        markets_key = hashlib.md5(
+            '\n'.join(sorted(markets)).encode()).hexdigest()
+        cache_path = f'triangles-{self.exchange.id}.pkl'
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached_key, triangular_pairs = pickle.load(f)
+                if cached_key == markets_key:
+                    self._build_index(triangular_pairs)
+                    return triangular_pairs
+            except Exception:
+                pass
+
+        # split هر نماد فقط یک بار؛ جفت‌ها با dict/set به جای اسکن خطی
+        # markets به ازای هر جفت USDT
+        by_base = defaultdict(list)
+        usdt_symbols = {}  # base -> نماد BASE/USDT
+        for symbol in markets:
+            parts = symbol.split('/')
+            if len(parts) != 2:
+                continue
+            base, quote = parts
+            by_base[base].append((quote, symbol))
+            if quote == 'USDT':
+                usdt_symbols[base] = symbol
+
         triangular_pairs = []
-        
-        # جفت‌هایی که با USDT شروع می‌شوند
-        base_pairs = [symbol for symbol in markets if symbol.endswith('/USDT')]
-        
-        for pair_a in base_pairs:
-            coin_a = pair_a.split('/')[0]  # مثلاً BTC
-            
-            # پیدا کردن جفت‌هایی که coin_a را دارند
-            for pair_b in markets:
-                if pair_b.startswith(coin_a + '/'):
-                    coin_b = pair_b.split('/')[1]  # مثلاً ETH
-                    pair_c = f"{coin_b}/USDT"
-                    
-                    if pair_c in markets:
-                        triangular_pairs.append({
-                            'path': [pair_a, pair_b, pair_c],
-                            'currencies': [self.base_currency, coin_a, coin_b, self.base_currency]
-                        })
-        
+        for coin_a, pair_a in usdt_symbols.items():
+            # جفت‌های coin_a/* با یک lookup، نه startswith روی همه بازارها
+            for coin_b, pair_b in by_base.get(coin_a, ()):
+                pair_c = usdt_symbols.get(coin_b)
+                if pair_c is not None:
+                    triangular_pairs.append({
+                        'path': [pair_a, pair_b, pair_c],
+                        'currencies': [self.base_currency, coin_a, coin_b, self.base_currency]
+                    })
+
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump((markets_key, triangular_pairs), f)
+        except Exception as e:
+            logging.error(f"Error caching triangles: {e}")
+
+        self._build_index(triangular_pairs)
         return triangular_pairs
     
     def calculate_arbitrage_opportunity(self, triangle, starting_amount=1000):
-        """محاسبه سود آربیتراژ برای یک مثلث"""
+        """محاسبه سود آربیتراژ برای یک مثلث (فقط lookup از self.book)"""
         try:
             pair_a, pair_b, pair_c = triangle['path']
             
-            # دریافت قیمت‌های bid/ask
-            prices_a = self.fetch_orderbook(pair_a)
-            prices_b = self.fetch_orderbook(pair_b)
-            prices_c = self.fetch_orderbook(pair_c)
+            # قیمت‌های bid/ask از top-of-book محلی — بدون رفت‌وبرگشت شبکه
+            _, ask_a = self.book.get(pair_a, (None, None))
+            _, ask_b = self.book.get(pair_b, (None, None))
+            bid_c, _ = self.book.get(pair_c, (None, None))
             
-            if not all([prices_a['ask'], prices_b['ask'], prices_c['bid']]):
+            if not all([ask_a, ask_b, bid_c]):
                 return None
             
-            # مسیر Forward: USDT -> BTC -> ETH -> USDT
-            step1 = starting_amount / prices_a['ask']  # خرید BTC
-            step2 = step1 / prices_b['ask']  # خرید ETH با BTC
-            step3 = step2 * prices_c['bid']  # فروش ETH به USDT
-            
-            # کسر کارمزد (معمولاً 0.1% در binance)
-            fee_rate = 0.001
-            final_amount = step3 * (1 - fee_rate) ** 3
+            # مسیر Forward: USDT -> BTC -> ETH -> USDT در یک عبارت —
+            # یک تقسیم به جای دو و ضریب کارمزد از پیش محاسبه‌شده
+            final_amount = (starting_amount * bid_c / (ask_a * ask_b)
+                            * self._fee_cube)
             
             profit_loss = final_amount - starting_amount
             profit_percent = (profit_loss / starting_amount) * 100
@@ -83,6 +235,47 @@ class TriangularArbitrageBot:
             return None
 
 
+    def scan_opportunities(self, starting_amount=1000):
+        """ارزیابی همه مثلث‌ها در کرنل کامپایل‌شده scan_triangles
+
+        کرنل γ و درصد سود را fused و موازی حساب می‌کند و ایندکس‌های
+        بالای آستانه را در بافرهای از پیش تخصیص‌یافته برمی‌گرداند؛ حلقه
+        پایتونی فقط روی برنده‌هاست.
+        """
+        # ارزیابی تفاضلی: فقط مثلث‌های با پای تغییرکرده از refresh قبلی
+        tri_ids = self._affected
+        if tri_ids is None:
+            idx_a, idx_b, idx_c = self._idx_a, self._idx_b, self._idx_c
+        else:
+            if tri_ids.size == 0:
+                return []
+            idx_a = self._idx_a[tri_ids]
+            idx_b = self._idx_b[tri_ids]
+            idx_c = self._idx_c[tri_ids]
+
+        n = idx_a.size
+        out_idx = np.empty(n, np.int32)
+        out_pct = np.empty(n, np.float32)
+        out_dir = np.empty(n, np.int8)
+        count = scan_triangles(self._ask, self._bid, idx_a, idx_b, idx_c,
+                               self.fee_rate, self.min_profit_threshold,
+                               out_idx, out_pct, out_dir)
+
+        opportunities = []
+        for k in range(count):
+            i = (int(out_idx[k]) if tri_ids is None
+                 else int(tri_ids[out_idx[k]]))
+            profit_percent = float(out_pct[k])
+            final = starting_amount * (1 + profit_percent / 100)
+            opportunities.append({
+                'triangle': self.triangles[i],
+                'profit_percent': profit_percent,
+                'profit_amount': final - starting_amount,
+                'final_amount': final,
+                'path_type': 'reverse' if out_dir[k] else 'forward'
+            })
+        return opportunities
+
     def execute_arbitrage(self, opportunity, investment_amount):
         """اجرای معاملات آربیتراژ"""
         try:
@@ -130,45 +323,70 @@ class TriangularArbitrageBot:
         
         triangles = self.find_triangular_pairs()
         logging.info(f"Found {len(triangles)} triangular pairs")
-        
+
         while True:
             try:
-                for triangle in triangles:
-                    opportunity = self.calculate_arbitrage_opportunity(triangle)
-                    
-                    if opportunity and opportunity['profit_percent'] > self.min_profit_threshold:
-                        logging.info(f"🎯 Opportunity found! Profit: {opportunity['profit_percent']:.2f}%")
-                        
-                        # ارسال نوتیفیکیشن تلگرام
-                        self.send_telegram_notification(opportunity)
-                        
-                        # اجرای معامله (در حالت production)
-                        # self.execute_arbitrage(opportunity, investment_amount=100)
-                        
-                time.sleep(1)  # تأخیر 1 ثانیه بین اسکن‌ها
+                # یک refresh bulk و سپس ارزیابی برداری کل مثلث‌ها
+                self.refresh_book(self.symbols)
+                for opportunity in self.scan_opportunities():
+                    logging.info(f"🎯 Opportunity found! Profit: {opportunity['profit_percent']:.2f}%")
+
+                    # ارسال نوتیفیکیشن تلگرام
+                    self.send_telegram_notification(opportunity)
+
+                    # اجرای معامله (در حالت production)
+                    # self.execute_arbitrage(opportunity, investment_amount=100)
+
+                # بدون sleep ثابت — نرخ اسکن را rate limiter خود ccxt
+                # (enableRateLimit) کنترل می‌کند و هر refresh فقط
+                # مثلث‌های تغییرکرده را دوباره ارزیابی می‌کند
                 
             except Exception as e:
                 logging.error(f"Error in main loop: {e}")
                 time.sleep(5)
 
 
-    import telegram
+    # قالب از پیش ساخته پیام؛ %-formatting یک فراخوانی C است و از ساختن
+    # دوباره f-string چندخطی در هر نوتیفیکیشن ارزان‌تر
+    _TG_TEMPLATE = (
+        "🔔 Arbitrage Opportunity Detected!\n\n"
+        "Path: %s\n"
+        "Profit: %.3f%%\n"
+        "Amount: $%.2f\n\n"
+        "Pairs:\n"
+        "1️⃣ %s\n"
+        "2️⃣ %s\n"
+        "3️⃣ %s"
+    )
 
     def send_telegram_notification(self, opportunity):
-        """ارسال پیام به تلگرام"""
-        bot = telegram.Bot(token='YOUR_TELEGRAM_BOT_TOKEN')
-        message = f"""
-        🔔 Arbitrage Opportunity Detected!
-        
-        Path: {' -> '.join(opportunity['triangle']['currencies'])}
-        Profit: {opportunity['profit_percent']:.3f}%
-        Amount: ${opportunity['profit_amount']:.2f}
-        
-        Pairs:
-        1️⃣ {opportunity['triangle']['path'][0]}
-        2️⃣ {opportunity['triangle']['path'][1]}
-        3️⃣ {opportunity['triangle']['path'][2]}
+        """صف کردن پیام تلگرام (غیرمسدودکننده برای حلقه اسکن)"""
+        triangle = opportunity['triangle']
+        path = triangle['path']
+        message = self._TG_TEMPLATE % (
+            ' -> '.join(triangle['currencies']),
+            opportunity['profit_percent'],
+            opportunity['profit_amount'],
+            path[0], path[1], path[2])
+        self._tg_queue.put_nowait(message)
+
+    def _tg_worker(self):
+        """ترد پس‌زمینه: فرصت‌های پشت‌سرهم در یک پیام batch می‌شوند
+
+        Bot فقط یک بار ساخته می‌شود؛ اگر چند فرصت در یک اسکن پیدا شود
+        همه با یک send_message می‌روند نه یکی‌یکی.
         """
-        bot.send_message(chat_id='YOUR_CHAT_ID', text=message)
+        while True:
+            messages = [self._tg_queue.get()]
+            while True:
+                try:
+                    messages.append(self._tg_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._tg_bot.send_message(chat_id=self._tg_chat,
+                                          text='\n'.join(messages))
+            except Exception as e:
+                logging.error(f"Error sending telegram notification: {e}")
 
 